@@ -0,0 +1,117 @@
+"""
+Benchmark for the MCTS player: measures its simulation rate (and that of
+the NumPy batch playout engine) and plays it against another agent at a
+range of time budgets.
+
+Usage:
+    python -m mcts_agent.benchmark <n> [-o opponent_module] [-b budget ...]
+        [-g games] [-k batch]
+
+Games are played directly through the referee's Game class (without its
+timers or display), alternating colours between games. Output printed by
+the players themselves is discarded.
+"""
+
+import io
+import argparse
+import importlib
+import contextlib
+
+from referee.game import Game
+from mcts_agent.player import Player
+from playing_agent.rollout import BatchRollout
+
+_COLOURS = ("red", "blue")
+
+
+def playout_rate(n, seconds=2.0, batch=0):
+    """
+    Returns the number of simulations per second of CPU time the MCTS
+    player runs from the empty board of size n.
+    """
+    player = Player("red", n, batch=batch)
+    player.search(seconds)
+    return player.playouts_per_second()
+
+
+def batch_rate(n, batches=4):
+    """
+    Returns the number of playouts per second of CPU time the batch engine
+    runs from the empty board of size n.
+    """
+    rollout = BatchRollout(n)
+    for _ in range(batches):
+        rollout.run([0] * (n * n), 1)
+    return rollout.playouts_per_second()
+
+
+def play_game(n, red, blue):
+    """
+    Play one game between two player instances, returning the referee's
+    result string.
+    """
+    game = Game(n)
+    players = (red, blue)
+    turn = 0
+    while not game.over():
+        colour = _COLOURS[turn % 2]
+        action = game.update(colour, players[turn % 2].action())
+        for player in players:
+            player.turn(colour, action)
+        turn += 1
+    return game.end()
+
+
+def match(n, opponent, budget, games, batch=0):
+    """
+    Play games between the MCTS player (with budget seconds per game, and
+    the given batch size) and the Player class of the opponent module,
+    returning the MCTS player's (wins, losses, draws) and its average
+    simulation rate.
+    """
+    Opponent = importlib.import_module(opponent).Player
+    wins = losses = draws = 0
+    playouts = search_time = 0.0
+    for i in range(games):
+        mcts_colour = _COLOURS[i % 2]
+        opp_colour = _COLOURS[1 - i % 2]
+        with contextlib.redirect_stdout(io.StringIO()):
+            mcts = Player(mcts_colour, n, time_budget=budget, batch=batch)
+            opp = Opponent(opp_colour, n)
+            red, blue = (mcts, opp) if mcts_colour == "red" else (opp, mcts)
+            result = play_game(n, red, blue)
+        playouts += mcts.playouts
+        search_time += mcts.search_time
+        if result == "winner: " + mcts_colour:
+            wins += 1
+        elif result.startswith("winner"):
+            losses += 1
+        else:
+            draws += 1
+    return (wins, losses, draws), playouts / search_time if search_time else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("n", type=int, help="board size")
+    parser.add_argument("-o", "--opponent", default="playing_agent",
+                        help="module of the opposing agent")
+    parser.add_argument("-b", "--budgets", type=float, nargs="+", default=[1.0, 4.0, 16.0],
+                        help="CPU seconds per game for the MCTS player")
+    parser.add_argument("-g", "--games", type=int, default=4,
+                        help="games per budget")
+    parser.add_argument("-k", "--batch", type=int, default=0,
+                        help="playouts per leaf with the batch engine (0 for none)")
+    args = parser.parse_args()
+
+    print(f"n={args.n}: {playout_rate(args.n, batch=args.batch):.0f} playouts/s "
+          f"from the empty board ({batch_rate(args.n):.0f} playouts/s "
+          f"for the batch engine alone)")
+    for budget in args.budgets:
+        (wins, losses, draws), rate = match(args.n, args.opponent, budget, args.games, args.batch)
+        print(f"budget {budget:g}s vs {args.opponent}: "
+              f"{wins} won, {losses} lost, {draws} drawn ({rate:.0f} playouts/s)")
+
+
+if __name__ == "__main__":
+    main()
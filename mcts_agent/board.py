@@ -0,0 +1,181 @@
+"""
+Compact board used by the MCTS player to play out simulated games.
+
+Cells are flat indices into a plain list of tokens (see playing_agent's
+geometry module). Each colour's connectivity is kept in a union-find forest
+with two extra nodes standing for the colour's two borders, so a win is
+detected in (almost) constant time after every move. Captures only ever
+remove tokens of one colour, so when they happen that colour's forest is
+simply rebuilt.
+"""
+
+from random import random
+
+from playing_agent.geometry import flat_coords, neighbour_table, capture_table
+
+# Token types (as in the 'referee' module)
+EMPTY = 0
+RED = 1
+BLUE = 2
+
+# Map between player token types (taken from the 'referee' module)
+SWAP_TOKEN = (0, 2, 1)
+
+# Axis goals for each token type (taken from the 'referee' module)
+_TOKEN_AXIS = {RED: 0, BLUE: 1}
+
+
+class PlayoutBoard:
+
+    def __init__(self, n):
+        """
+        Create an empty board of size n.
+        """
+        self.n = n
+        nn = n * n
+        self.coords = flat_coords(n)
+        self.neighbours = neighbour_table(n)
+        self.capture_patterns = capture_table(n)
+        self.cells = [EMPTY] * nn
+
+        # Union-find nodes of the borders: token t owns nodes nn + 2(t - 1)
+        # (low side of its axis) and nn + 2(t - 1) + 1 (high side)
+        self.border_nodes = {token: (nn + 2 * (token - 1), nn + 2 * (token - 1) + 1)
+                             for token in (RED, BLUE)}
+
+        # Border nodes each cell is joined to, for each token type
+        self.borders = {}
+        for token, axis in _TOKEN_AXIS.items():
+            low, high = self.border_nodes[token]
+            self.borders[token] = [(low,) * (coord[axis] == 0) + (high,) * (coord[axis] == n - 1)
+                                   for coord in self.coords]
+
+        self.parent = list(range(nn + 4))
+
+    def copy(self):
+        """
+        Returns an independent copy of the board (sharing the read-only
+        geometry tables).
+        """
+        board = PlayoutBoard.__new__(PlayoutBoard)
+        board.__dict__.update(self.__dict__)
+        board.cells = self.cells[:]
+        board.parent = self.parent[:]
+        return board
+
+    def empty_cells(self):
+        """
+        Returns the flat indices of every empty cell.
+        """
+        return [cell for cell, token in enumerate(self.cells) if token == EMPTY]
+
+    def _find(self, node):
+        parent = self.parent
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    def _join(self, cell, token):
+        """
+        Union a newly placed token with its neighbours and border.
+        """
+        find = self._find
+        parent = self.parent
+        cells = self.cells
+        root = find(cell)
+        for border in self.borders[token][cell]:
+            other = find(border)
+            if other != root:
+                parent[other] = root
+        for neighbour in self.neighbours[cell]:
+            if cells[neighbour] == token:
+                other = find(neighbour)
+                if other != root:
+                    parent[other] = root
+
+    def _rebuild(self, token):
+        """
+        Recompute the union-find forest of one token type from scratch.
+        """
+        parent = self.parent
+        cells = self.cells
+        low, high = self.border_nodes[token]
+        parent[low] = low
+        parent[high] = high
+        for cell, held in enumerate(cells):
+            if held == token:
+                parent[cell] = cell
+        for cell, held in enumerate(cells):
+            if held == token:
+                self._join(cell, token)
+
+    def place(self, cell, token):
+        """
+        Place a token on an empty cell and apply any captures it makes,
+        returning the list of captured cells.
+        """
+        cells = self.cells
+        cells[cell] = token
+        self.parent[cell] = cell
+        self._join(cell, token)
+
+        opp = SWAP_TOKEN[token]
+        captured = []
+        for opposite, mid1, mid2 in self.capture_patterns[cell]:
+            if cells[opposite] == token and cells[mid1] == opp and cells[mid2] == opp:
+                captured.append(mid1)
+                captured.append(mid2)
+        if captured:
+            for mid in captured:
+                cells[mid] = EMPTY
+            self._rebuild(opp)
+            # Overlapping diamonds can capture the same cell twice
+            captured = list(set(captured))
+        return captured
+
+    def connected(self, token):
+        """
+        True iff the tokens of the given type connect their two borders.
+        """
+        low, high = self.border_nodes[token]
+        return self._find(low) == self._find(high)
+
+    def swap(self):
+        """
+        Apply a STEAL action: mirror the board along its major axis and swap
+        the token types (see the 'referee' module).
+        """
+        n = self.n
+        old = self.cells
+        self.cells = [SWAP_TOKEN[old[q * n + r]] for r, q in self.coords]
+        self._rebuild(RED)
+        self._rebuild(BLUE)
+
+    def playout(self, token, empty, max_moves, played):
+        """
+        Play uniformly random moves, starting with the given token type to
+        move, until one player connects their borders or max_moves moves
+        have been made. The list empty must hold the empty cells (it is
+        used up), and every move made is appended to played as a
+        (cell, token) pair. Returns the winning token type, or EMPTY if the
+        game was cut short.
+        """
+        place = self.place
+        connected = self.connected
+        append = played.append
+        for _ in range(max_moves):
+            if not empty:
+                break
+            i = int(random() * len(empty))
+            cell = empty[i]
+            empty[i] = empty[-1]
+            empty.pop()
+            append((cell, token))
+            captured = place(cell, token)
+            if captured:
+                empty.extend(captured)
+            if connected(token):
+                return token
+            token = SWAP_TOKEN[token]
+        return EMPTY
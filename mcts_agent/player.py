@@ -0,0 +1,323 @@
+import os
+import time
+
+from mcts_agent.board import PlayoutBoard, EMPTY, RED, BLUE, SWAP_TOKEN
+from mcts_agent.tree import NodePool, UNEXPANDED
+from playing_agent.rollout import BatchRollout
+
+# Action types (taken from 'referee' module)
+_ACTION_PLACE = "PLACE"
+_ACTION_STEAL = "STEAL"
+
+# Maps between player string and internal token type (taken from the 'referee' module)
+_TOKEN_MAP_OUT = {0: None, 1: "red", 2: "blue"}
+_TOKEN_MAP_IN = {v: k for k, v in _TOKEN_MAP_OUT.items()}
+
+# Number of turns after which the game is drawn (taken from the 'referee' module)
+_MAX_TURNS = 343
+
+# CPU time (in seconds) the player may spend searching over a whole game
+_TIME_BUDGET = float(os.environ.get("MCTS_AGENT_TIME", 30.0))
+
+# The remaining time is shared between at least this many moves
+_MIN_MOVES_LEFT = 8
+
+# Number of visits after which a leaf node is expanded
+_EXPAND_VISITS = 2
+
+# Number of simulations run between checks of the clock
+_CHECK_INTERVAL = 16
+
+# Number of playouts run together from each leaf by the NumPy batch engine
+# (0 to play out one game at a time in Python)
+_BATCH = int(os.environ.get("MCTS_AGENT_BATCH", 0))
+
+
+class Player:
+
+    def __init__(self, player, n, time_budget=None, batch=None):
+        """
+        Called once at the beginning of a game to initialise this player.
+        Set up an internal representation of the game state.
+
+        The parameter player is the string "red" if the player will
+        play as Red, or the string "blue" if the player will play
+        as Blue. The optional parameter time_budget is the CPU time (in
+        seconds) to spend searching over the whole game (by default taken
+        from MCTS_AGENT_TIME), and batch is the number of playouts to run
+        together from each leaf (by default taken from MCTS_AGENT_BATCH).
+        """
+        self.player = player
+        self.token = _TOKEN_MAP_IN[player]
+        self.n = n
+        self.n_turns = 0
+        self.board = PlayoutBoard(n)
+        self.tree = NodePool()
+
+        if batch is None:
+            batch = _BATCH
+        self.rollout = BatchRollout(n, batch) if batch > 0 else None
+
+        self.time_left = _TIME_BUDGET if time_budget is None else time_budget
+
+        # Simulations run and CPU time spent searching, over the whole game
+        self.playouts = 0
+        self.search_time = 0.0
+
+    def action(self):
+        """
+        Called at the beginning of the turn. Based on the current state
+        of the game, select an action to play.
+        """
+        start = time.process_time()
+
+        if self.n_turns == 1 and self.should_steal():
+            action = (_ACTION_STEAL,)
+        else:
+            empty = self.board.empty_cells()
+            budget = self.time_left / max(_MIN_MOVES_LEFT, (len(empty) + 1) // 2)
+            r, q = self.board.coords[self.search(budget)]
+            action = (_ACTION_PLACE, r, q)
+
+        self.time_left -= time.process_time() - start
+        return action
+
+    def turn(self, player, action):
+        """
+        Called at the end of each player's turn to inform this player of
+        their chosen action. Update your internal representation of the
+        game state based on this. The parameter action is the chosen
+        action itself.
+
+        Note: At the end of your player's turn, the action parameter is
+        the same as what your player returned from the action method
+        above. However, the referee has validated it at this point.
+        """
+        if action[0] == _ACTION_PLACE:
+            _, r, q = action
+            self.board.place(r * self.n + q, _TOKEN_MAP_IN[player])
+        elif action[0] == _ACTION_STEAL:
+            self.board.swap()
+        self.n_turns += 1
+
+    def is_edge(self, cell):
+        """
+        True iff cell lies on the outer ring of the board.
+        """
+        r, q = self.board.coords[cell]
+        return r in (0, self.n - 1) or q in (0, self.n - 1)
+
+    def should_steal(self):
+        """
+        Decide whether to steal Red's opening move: any opening away from
+        the edge of the board is strong enough to be worth taking.
+        """
+        for cell, token in enumerate(self.board.cells):
+            if token != EMPTY:
+                return not self.is_edge(cell)
+        return False
+
+    def root_moves(self):
+        """
+        Returns the moves considered at the root of the search.
+        """
+        empty = self.board.empty_cells()
+        if self.n_turns == 0:
+            # Blue may steal the opening, so open on the edge of the board
+            # (which also rules out the forbidden centre cell)
+            empty = [cell for cell in empty if self.is_edge(cell)]
+        return empty
+
+    def search(self, budget):
+        """
+        Run simulations from the current position for budget seconds of CPU
+        time, returning the most visited move.
+        """
+        start = time.process_time()
+        tree = self.tree
+        tree.clear()
+        tree.expand(0, self.root_moves())
+        if tree.num_children[0] == 1:
+            return tree.move[tree.first_child[0]]
+
+        deadline = start + budget
+        playouts = 0
+        while True:
+            for _ in range(_CHECK_INTERVAL):
+                playouts += self.simulate()
+            if time.process_time() >= deadline:
+                break
+
+        self.playouts += playouts
+        self.search_time += time.process_time() - start
+        return tree.move[tree.most_visited_child(0)]
+
+    def root_value(self):
+        """
+        Returns the estimated chance of the player winning from the position
+        last searched (the win rate of its most visited move).
+        """
+        tree = self.tree
+        child = tree.most_visited_child(0)
+        if child < 0 or tree.visits[child] == 0:
+            return 0.5
+        return tree.wins[child] / tree.visits[child]
+
+    def simulate(self):
+        """
+        Run one simulation: descend the tree, expand it, play the game out
+        at random (a whole batch of times with the batch engine) and back up
+        the result. Returns the number of playouts made.
+        """
+        tree = self.tree
+        first_child = tree.first_child
+        move = tree.move
+        board = self.board.copy()
+        max_moves = _MAX_TURNS - self.n_turns
+
+        token = self.token
+        node = 0
+        path = [0]
+        played = []
+        winner = None
+
+        # Selection
+        while first_child[node] != UNEXPANDED and tree.num_children[node] > 0:
+            node = tree.select_child(node)
+            path.append(node)
+            cell = move[node]
+            played.append((cell, token))
+            board.place(cell, token)
+            if board.connected(token):
+                winner = token
+                break
+            token = SWAP_TOKEN[token]
+
+        if winner is None:
+            empty = board.empty_cells()
+
+            # Expansion
+            if tree.visits[node] >= _EXPAND_VISITS and empty and len(played) < max_moves:
+                tree.expand(node, empty)
+                node = tree.select_child(node)
+                path.append(node)
+                cell = move[node]
+                played.append((cell, token))
+                captured = board.place(cell, token)
+                empty.remove(cell)
+                empty.extend(captured)
+                if board.connected(token):
+                    winner = token
+                token = SWAP_TOKEN[token]
+
+            # Playout
+            if winner is None:
+                if self.rollout is not None:
+                    winners, first = self.rollout.run(board.cells, token, max_moves - len(played),
+                                                      record=True)
+                    self.backup_batch(path, winners, first)
+                    return len(winners)
+                winner = board.playout(token, empty, max_moves - len(played), played)
+
+        self.backup(path, played, winner)
+        return 1
+
+    def backup(self, path, played, winner):
+        """
+        Update the statistics of the nodes on path with the result of a
+        simulation, along with the all-moves-as-first (AMAF) statistics of
+        their children.
+        """
+        tree = self.tree
+        visits = tree.visits
+        wins = tree.wins
+        amaf_visits = tree.amaf_visits
+        amaf_wins = tree.amaf_wins
+        move = tree.move
+
+        red_result = 1.0 if winner == RED else 0.0 if winner == BLUE else 0.5
+
+        # Token type that first played each cell after the node being
+        # updated, starting with the moves played after the whole path
+        first_player = [EMPTY] * len(self.board.cells)
+        for cell, token in reversed(played[len(path) - 1:]):
+            first_player[cell] = token
+
+        for depth in range(len(path) - 1, -1, -1):
+            node = path[depth]
+            to_move = self.token if depth % 2 == 0 else SWAP_TOKEN[self.token]
+            result = red_result if to_move == RED else 1.0 - red_result
+
+            # The node's own move was made by the other player
+            visits[node] += 1
+            wins[node] += 1.0 - result
+
+            for child in tree.children(node):
+                if first_player[move[child]] == to_move:
+                    amaf_visits[child] += 1
+                    amaf_wins[child] += result
+
+            if depth > 0:
+                first_player[move[node]] = SWAP_TOKEN[to_move]
+
+    def backup_batch(self, path, winners, first):
+        """
+        Update the statistics of the nodes on path, and the AMAF statistics
+        of their children, with the results of a batch of playouts from the
+        leaf of path (winners and first as returned by BatchRollout.run).
+        """
+        tree = self.tree
+        visits = tree.visits
+        wins = tree.wins
+        amaf_visits = tree.amaf_visits
+        amaf_wins = tree.amaf_wins
+        move = tree.move
+
+        k = len(winners)
+        red_results = (winners == RED) + 0.5 * (winners == EMPTY)
+        red_total = float(red_results.sum())
+
+        # Number of playouts in which each token type was first to play on
+        # each cell, and Red's total result over those playouts
+        counts = {}
+        red_wins = {}
+        for token in (RED, BLUE):
+            played_by = first == token
+            counts[token] = played_by.sum(axis=0).tolist()
+            red_wins[token] = (red_results @ played_by).tolist()
+
+        # Token type of the tree moves played after the node being updated
+        tree_moves = {}
+
+        for depth in range(len(path) - 1, -1, -1):
+            node = path[depth]
+            to_move = self.token if depth % 2 == 0 else SWAP_TOKEN[self.token]
+            total = red_total if to_move == RED else k - red_total
+
+            visits[node] += k
+            wins[node] += k - total
+
+            own_counts = counts[to_move]
+            own_red_wins = red_wins[to_move]
+            for child in tree.children(node):
+                cell = move[child]
+                mover = tree_moves.get(cell)
+                if mover is None:
+                    played = own_counts[cell]
+                    if played:
+                        amaf_visits[child] += played
+                        amaf_wins[child] += own_red_wins[cell] if to_move == RED else played - own_red_wins[cell]
+                elif mover == to_move:
+                    amaf_visits[child] += k
+                    amaf_wins[child] += total
+
+            if depth > 0:
+                tree_moves[move[node]] = SWAP_TOKEN[to_move]
+
+    def playouts_per_second(self):
+        """
+        Returns the average rate of simulations over the game so far.
+        """
+        if self.search_time == 0:
+            return 0.0
+        return self.playouts / self.search_time
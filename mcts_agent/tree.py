@@ -0,0 +1,142 @@
+"""
+Search tree of the MCTS player, stored as a pool of nodes in flat arrays.
+
+Every node is an index into a set of parallel lists (its move, parent,
+children and statistics), rather than a Python object of its own. The
+children of a node are allocated together as one contiguous block, so a
+node only needs to know where its block starts and how long it is. The
+lists are allocated once and reused for every search: clearing the tree
+only resets the number of nodes in use.
+"""
+
+from math import log, sqrt
+
+# Number of nodes the pool starts with (it grows as needed)
+_INITIAL_CAPACITY = 1 << 16
+
+# Exploration constant of the UCT bound
+_EXPLORATION = 0.05
+
+# Equivalence parameter of the RAVE schedule: the number of real visits at
+# which the real and AMAF values of a move are weighted equally
+_RAVE_EQUIVALENCE = 500
+
+# Value assumed for moves with no statistics at all
+_FIRST_PLAY_URGENCY = 1.1
+
+# Marker for nodes whose children have not been created yet
+UNEXPANDED = -1
+
+
+class NodePool:
+
+    def __init__(self, capacity=_INITIAL_CAPACITY):
+        """
+        Allocate a pool able to hold capacity nodes before growing.
+        """
+        self.capacity = 0
+        self.move = []
+        self.parent = []
+        self.first_child = []
+        self.num_children = []
+        self.visits = []
+        self.wins = []
+        self.amaf_visits = []
+        self.amaf_wins = []
+        self._grow(capacity)
+        self.clear()
+
+    def _grow(self, capacity):
+        """
+        Extend every array so that the pool holds capacity nodes.
+        """
+        extra = capacity - self.capacity
+        self.move.extend([-1] * extra)
+        self.parent.extend([-1] * extra)
+        self.first_child.extend([UNEXPANDED] * extra)
+        self.num_children.extend([0] * extra)
+        self.visits.extend([0] * extra)
+        self.wins.extend([0.0] * extra)
+        self.amaf_visits.extend([0] * extra)
+        self.amaf_wins.extend([0.0] * extra)
+        self.capacity = capacity
+
+    def _reset(self, node, move, parent):
+        self.move[node] = move
+        self.parent[node] = parent
+        self.first_child[node] = UNEXPANDED
+        self.num_children[node] = 0
+        self.visits[node] = 0
+        self.wins[node] = 0.0
+        self.amaf_visits[node] = 0
+        self.amaf_wins[node] = 0.0
+
+    def clear(self):
+        """
+        Empty the tree, leaving only a fresh root node (node 0).
+        """
+        self.size = 1
+        self._reset(0, -1, -1)
+
+    def expand(self, node, moves):
+        """
+        Create one child of node for each move in moves.
+        """
+        first = self.size
+        if first + len(moves) > self.capacity:
+            self._grow(max(2 * self.capacity, first + len(moves)))
+        for i, move in enumerate(moves):
+            self._reset(first + i, move, node)
+        self.first_child[node] = first
+        self.num_children[node] = len(moves)
+        self.size = first + len(moves)
+
+    def select_child(self, node):
+        """
+        Returns the child of node with the highest UCT-RAVE value, from the
+        point of view of the player choosing among them.
+        """
+        visits = self.visits
+        wins = self.wins
+        amaf_visits = self.amaf_visits
+        amaf_wins = self.amaf_wins
+        explore = _EXPLORATION * sqrt(log(visits[node] + 1))
+
+        best_value = -1.0
+        best = -1
+        first = self.first_child[node]
+        for child in range(first, first + self.num_children[node]):
+            n = visits[child]
+            amaf_n = amaf_visits[child]
+            if amaf_n == 0:
+                if n == 0:
+                    value = _FIRST_PLAY_URGENCY
+                else:
+                    value = wins[child] / n + explore / sqrt(n)
+            else:
+                beta = sqrt(_RAVE_EQUIVALENCE / (3 * n + _RAVE_EQUIVALENCE))
+                amaf_value = amaf_wins[child] / amaf_n
+                if n == 0:
+                    value = amaf_value + explore
+                else:
+                    value = (1 - beta) * wins[child] / n + beta * amaf_value + explore / sqrt(n)
+            if value > best_value:
+                best_value = value
+                best = child
+        return best
+
+    def children(self, node):
+        """
+        Returns the range of indices of the children of node.
+        """
+        first = self.first_child[node]
+        if first == UNEXPANDED:
+            return range(0)
+        return range(first, first + self.num_children[node])
+
+    def most_visited_child(self, node):
+        """
+        Returns the child of node searched the most (or -1 if it has none).
+        """
+        visits = self.visits
+        return max(self.children(node), key=visits.__getitem__, default=-1)
@@ -0,0 +1,108 @@
+"""
+Benchmark for the playing agent's search: searches a fixed set of positions
+with its search enhancements switched on one after another, and reports the
+nodes searched and how often the first move searched at a node causes its
+cutoff. It first reports how long creating a player takes (which the referee
+times), for the first player of the board size in the process and for later
+ones.
+
+Usage:
+    python -m playing_agent.benchmark <n> [-p positions] [-s seed]
+
+The positions are reached by random play from the empty board (with a fixed
+seed, so every run searches the same ones). Output printed by the player
+itself is discarded.
+"""
+
+import io
+import time
+import random
+import argparse
+import contextlib
+
+from playing_agent.player import Player
+
+_COLOURS = ("red", "blue")
+
+# Search settings compared, as keyword arguments for the player
+SETTINGS = (
+    ("plain alpha-beta", dict(ordering=False)),
+    ("+ killers/history", dict(ordering=True)),
+)
+
+
+def random_positions(n, count, seed):
+    """
+    Returns count lists of actions, each reaching a position of random play
+    between a quarter and a half of the way to a full board.
+    """
+    rng = random.Random(seed)
+    positions = []
+    for _ in range(count):
+        cells = [(r, q) for r in range(n) for q in range(n)]
+        if n % 2 == 1:
+            cells.remove((n // 2, n // 2))
+        rng.shuffle(cells)
+        length = rng.randint(n * n // 4, n * n // 2)
+        positions.append([("PLACE", r, q) for r, q in cells[:length]])
+    return positions
+
+
+def search_stats(n, positions, options):
+    """
+    Search every position (for the player to move) with a player created
+    with the given options, returning its nodes searched, cutoffs, first
+    move cutoffs and the CPU time taken, summed over the positions.
+    """
+    nodes = cutoffs = first_move_cutoffs = 0
+    elapsed = 0.0
+    for actions in positions:
+        with contextlib.redirect_stdout(io.StringIO()):
+            player = Player(_COLOURS[len(actions) % 2], n, **options)
+            for i, action in enumerate(actions):
+                player.turn(_COLOURS[i % 2], action)
+            start = time.process_time()
+            player.make_best_move()
+            elapsed += time.process_time() - start
+        nodes += player.nodes
+        cutoffs += player.cutoffs
+        first_move_cutoffs += player.first_move_cutoffs
+    return nodes, cutoffs, first_move_cutoffs, elapsed
+
+
+def startup_times(n, count):
+    """
+    Create count players for boards of size n, returning the wall time the
+    first took and the mean time the others took, in seconds.
+    """
+    times = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(count):
+            start = time.perf_counter()
+            Player(_COLOURS[i % 2], n)
+            times.append(time.perf_counter() - start)
+    return times[0], sum(times[1:]) / max(1, count - 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("n", type=int, help="board size")
+    parser.add_argument("-p", "--positions", type=int, default=20,
+                        help="number of positions searched")
+    parser.add_argument("-s", "--seed", type=int, default=0,
+                        help="seed of the random play reaching the positions")
+    args = parser.parse_args()
+
+    first, later = startup_times(args.n, 20)
+    print(f"startup: {1000 * first:.1f}ms for the first player, {1000 * later:.2f}ms for later ones")
+
+    positions = random_positions(args.n, args.positions, args.seed)
+    for name, options in SETTINGS:
+        nodes, cutoffs, first, elapsed = search_stats(args.n, positions, options)
+        rate = first / cutoffs if cutoffs else 0.0
+        print(f"{name}: {nodes} nodes, {cutoffs} cutoffs, {rate:.1%} on the first move "
+              f"({elapsed:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
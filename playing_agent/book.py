@@ -0,0 +1,209 @@
+"""
+Opening books: the move to play in early positions, looked up by key.
+
+A book for a board of size n is a file holding a short header followed by
+two arrays: the sorted canonical Zobrist keys of its positions, and the
+move for each of them (a flat cell index in the canonical orientation, or
+STEAL). The arrays are memory-mapped rather than read, so opening a book
+costs next to nothing and every process playing on the same machine shares
+a single copy of it. A lookup is a binary search of the key array.
+
+Books are built offline, by running:
+
+    python -m playing_agent.build_book <n> [--plies p] [--budget seconds]
+
+which searches every position of the first p plies in which one player has
+kept to the book while the other played anything, using the MCTS player's
+search as the oracle.
+"""
+
+import os
+import struct
+
+import numpy as np
+
+from playing_agent.zobrist import canonical_key, transform_cell
+
+# Move code for the STEAL action
+STEAL = 0xFFFF
+
+# File layout: magic, version, board size, number of plies, number of
+# positions, then the keys (uint64) and moves (uint16) of every position
+_MAGIC = b"CXBK"
+_VERSION = 2
+_HEADER = struct.Struct("<4sHHHxxI")
+
+# Directory holding the books that come with the agent
+BOOK_DIR = os.path.join(os.path.dirname(__file__), "books")
+
+# Books opened so far in this process, keyed by board size (None if there
+# is no book for that size)
+_OPEN_BOOKS = {}
+
+
+def book_path(n):
+    """
+    Returns the path of the book for boards of size n.
+    """
+    return os.path.join(BOOK_DIR, f"book_{n}.bin")
+
+
+class OpeningBook:
+
+    def __init__(self, path):
+        """
+        Memory-map the book stored at path.
+        """
+        with open(path, "rb") as f:
+            magic, version, n, plies, count = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f"{path} is not an opening book")
+        self.n = n
+        self.plies = plies
+        self.count = count
+        if count:
+            self.keys = np.memmap(path, dtype="<u8", mode="r", offset=_HEADER.size, shape=(count,))
+            self.moves = np.memmap(path, dtype="<u2", mode="r", offset=_HEADER.size + 8 * count,
+                                   shape=(count,))
+        else:
+            self.keys = np.zeros(0, dtype="<u8")
+            self.moves = np.zeros(0, dtype="<u2")
+
+    @staticmethod
+    def load(n):
+        """
+        Returns the book for boards of size n (shared by every player in the
+        process), or None if there is none.
+        """
+        if n not in _OPEN_BOOKS:
+            path = book_path(n)
+            _OPEN_BOOKS[n] = OpeningBook(path) if os.path.exists(path) else None
+        return _OPEN_BOOKS[n]
+
+    def lookup(self, cells, to_move):
+        """
+        Returns the book move for the position with the given token on each
+        flat index and token type to move: a flat cell index, STEAL, or None
+        if the position is not in the book.
+        """
+        key, transform = canonical_key(cells, self.n, to_move)
+        i = int(np.searchsorted(self.keys, np.uint64(key)))
+        if i == self.count or int(self.keys[i]) != key:
+            return None
+        move = int(self.moves[i])
+        if move == STEAL:
+            return STEAL
+        return transform_cell(move, self.n, transform)
+
+
+def write_book(path, n, plies, entries):
+    """
+    Write a book holding entries, a dictionary from canonical key to move
+    (in the canonical orientation).
+    """
+    keys = np.array(sorted(entries), dtype="<u8")
+    moves = np.array([entries[int(key)] for key in keys], dtype="<u2")
+    with open(path, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, _VERSION, n, plies, len(keys)))
+        f.write(keys.tobytes())
+        f.write(moves.tobytes())
+
+
+class BookBuilder:
+
+    def __init__(self, n, plies, budget):
+        """
+        Prepare to build the book for boards of size n, covering the first
+        plies plies, searching each position for budget seconds.
+        """
+        self.n = n
+        self.plies = plies
+        self.budget = budget
+
+        # Canonical key -> canonical move
+        self.entries = {}
+
+        # Blue's chance of winning after each opening (if not stealing)
+        self.opening_values = {}
+
+    def oracle(self, actions):
+        """
+        Returns an MCTS player for the side to move after the given actions,
+        with the actions played on its board.
+        """
+        # Imported here as the MCTS player is itself built on this package
+        from mcts_agent.player import Player as MctsPlayer
+
+        colour = ("red", "blue")[len(actions) % 2]
+        player = MctsPlayer(colour, self.n, time_budget=float("inf"))
+        for i, action in enumerate(actions):
+            player.turn(("red", "blue")[i % 2], action)
+        return player
+
+    def place_action(self, cell):
+        return ("PLACE", cell // self.n, cell % self.n)
+
+    def add(self, actions, move=None):
+        """
+        Add the position reached by actions to the book (searching for its
+        move unless one is given), returning the action to play there, or
+        None if the position was already in the book.
+        """
+        oracle = self.oracle(actions)
+        to_move = oracle.token
+        key, transform = canonical_key(oracle.board.cells, self.n, to_move)
+        if key in self.entries:
+            return None
+
+        if move is None:
+            move = oracle.search(self.budget)
+            if len(actions) == 1:
+                # Stealing the opening gives Blue the position Red would
+                # have had if Blue had replied to it
+                value = oracle.root_value()
+                self.opening_values[actions[0]] = value
+                if value < 0.5:
+                    move = STEAL
+
+        if move == STEAL:
+            self.entries[key] = STEAL
+            return ("STEAL",)
+        self.entries[key] = transform_cell(move, self.n, transform)
+        return self.place_action(move)
+
+    def expand(self, actions, move=None):
+        """
+        Add the position reached by actions, and every position the side to
+        move can face within the book's plies if it keeps to the book.
+        """
+        action = self.add(actions, move)
+        if action is None or len(actions) + 2 >= self.plies:
+            return
+        reply_to = actions + [action]
+        oracle = self.oracle(reply_to)
+        replies = [self.place_action(cell) for cell in oracle.board.empty_cells()]
+        if len(reply_to) == 1:
+            replies.append(("STEAL",))
+        for reply in replies:
+            self.expand(reply_to + [reply])
+
+    def build(self):
+        """
+        Build the book, returning its entries.
+        """
+        n = self.n
+        centre = (n // 2) * n + n // 2 if n % 2 == 1 else -1
+        openings = [self.place_action(cell) for cell in range(n * n) if cell != centre]
+
+        # Blue's positions, after every possible opening
+        if self.plies > 1:
+            for opening in openings:
+                self.expand([opening])
+
+        # Red opens where Blue gains the least whether it steals or not
+        best = min(self.opening_values, key=lambda opening: abs(self.opening_values[opening] - 0.5),
+                   default=None)
+        if best is None:
+            best = openings[0]
+        self.expand([], best[1] * n + best[2])
+        return self.entries
@@ -0,0 +1,36 @@
+"""
+Builds the opening book for one board size (see the book module).
+
+Usage:
+    python -m playing_agent.build_book <n> [--plies p] [--budget seconds] [--output path]
+
+The command line lives apart from the book module, which the player imports
+along with the package, so that running it does not import that module a
+second time as __main__.
+"""
+
+import os
+import argparse
+
+from playing_agent.book import BookBuilder, book_path, write_book
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the opening book for one board size.")
+    parser.add_argument("n", type=int, help="board size")
+    parser.add_argument("--plies", type=int, default=3,
+                        help="number of plies (turns) the book covers")
+    parser.add_argument("--budget", type=float, default=1.0,
+                        help="CPU seconds of search per position")
+    parser.add_argument("--output", help="book file (by default the agent's book for n)")
+    args = parser.parse_args()
+
+    entries = BookBuilder(args.n, args.plies, args.budget).build()
+    path = args.output or book_path(args.n)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    write_book(path, args.n, args.plies, entries)
+    print(f"wrote {len(entries)} positions to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Builds the solved table for one (small) board size (see the solver module).
+
+Usage:
+    python -m playing_agent.build_table <n> [--output path]
+
+The command line lives apart from the solver module, which the player
+imports along with the package (for the proof-number search), so that
+running it does not import that module a second time as __main__.
+"""
+
+import os
+import sys
+import argparse
+
+import numpy as np
+
+from playing_agent.solver import Solver, SolvedTable, table_path, write_table
+
+# Number of positions checked against their best move (every position of a
+# table with fewer)
+_SAMPLE = 1 << 16
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Solve one (small) board size exactly.")
+    parser.add_argument("n", type=int, help="board size")
+    parser.add_argument("--output", help="table file (by default the agent's table for n)")
+    args = parser.parse_args()
+
+    solver = Solver(args.n)
+    entries = solver.solve_all(lambda plies, settled: print(f"{plies} plies: {settled} positions"))
+    path = args.output or table_path(args.n)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    write_table(path, args.n, entries)
+    table = SolvedTable(path)
+    value, plies = table.value([0] * (args.n * args.n), 1)
+    print(f"red {('?', 'wins', 'loses', 'draws')[value]} (in {plies} plies): "
+          f"wrote {len(entries)} positions to {path}")
+
+    # Every position's entry has to be borne out by the move played from
+    # it (checked on a sample of the positions of large tables)
+    keys = range(len(entries))
+    if len(entries) > _SAMPLE:
+        keys = np.random.default_rng(0).choice(len(entries), _SAMPLE, replace=False).tolist()
+    unsound = table.unsound(keys)
+    if unsound:
+        sys.exit(f"error: {unsound} positions are not borne out by their best move")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Bounded cache of position evaluations.
+
+The static evaluation only depends on the tokens on the board, so the search
+keeps the scores of the positions it evaluates, keyed by their Zobrist key,
+and reuses them when a position comes up again by a different move order.
+Symmetric variants of a position are not looked up under one key, as the
+evaluation breaks ties between equally long chains by where they lie on the
+board, so that a cached score is always the one evaluating afresh gives.
+
+The cache holds a fixed number of entries, worked out from a byte budget,
+and evicts the least recently used entry once it is full, so its size stays
+the same however long the game goes on. Its actual size can be measured
+with EvalCache.nbytes.
+"""
+
+import sys
+
+from collections import OrderedDict
+
+# Memory used per cached entry (an OrderedDict slot, its links, and a 64-bit
+# key), as measured with tracemalloc at its worst between table resizes
+_ENTRY_BYTES = 160
+_KEY_BYTES = sys.getsizeof(1 << 63)
+
+
+class EvalCache:
+
+    def __init__(self, budget):
+        """
+        Create an empty cache taking up at most about budget bytes.
+        """
+        self.capacity = max(1, budget // _ENTRY_BYTES)
+        self.entries = OrderedDict()
+
+        # Lookups that found their position, and that did not
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        Returns the score cached for key (None if there is none), marking it
+        as the most recently used.
+        """
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        """
+        Cache the score of key, evicting the least recently used entry if the
+        cache is full.
+        """
+        entries = self.entries
+        entries[key] = value
+        if len(entries) > self.capacity:
+            entries.popitem(last=False)
+
+    def nbytes(self):
+        """
+        Returns the memory taken up by the cache (its table and keys; scores
+        are small integers shared by the interpreter).
+        """
+        return sys.getsizeof(self.entries) + len(self.entries) * _KEY_BYTES
@@ -0,0 +1,307 @@
+"""
+Incrementally maintained chains (connected groups) of one player's tokens.
+
+A ChainTracker labels every token of its colour with the id of the chain it
+belongs to, and keeps the size and the two endpoints (lowest and highest
+cell along the player's axis) of each chain. Placing a token merges the
+chains around it, removing one re-splits only the chain it belonged to, and
+the longest chain is available without scanning the board. As with the
+distance maps, changes are recorded on a trail so they can be undone.
+"""
+
+import numpy as np
+
+from playing_agent.geometry import flat_coords, neighbour_table
+
+# Trail record kinds
+_LABEL = 0
+_CHAIN = 1
+_BUCKET_ADD = 2
+_BUCKET_REMOVE = 3
+_MAX_SIZE = 4
+
+
+class ChainTracker:
+
+    def __init__(self, n, axis):
+        """
+        Track the chains of a player aiming to connect along axis, on an
+        empty board of size n.
+        """
+        self.n = n
+        self.coords = flat_coords(n)
+        self.neighbours = neighbour_table(n)
+
+        # Sort keys for picking chain endpoints: lowest/highest axis value,
+        # then lowest flat index
+        self._low_key = [(coord[axis], i) for i, coord in enumerate(self.coords)]
+        self._high_key = [(-coord[axis], i) for i, coord in enumerate(self.coords)]
+
+        # Order in which a row-by-row scan of the board (from the top row
+        # down) reaches each cell; ties between equally long chains go to
+        # the chain such a scan would find first
+        self._scan_key = [(n - 1 - r) * n + q for r, q in self.coords]
+
+        # The same keys as ranks (and the cell of each rank) for batches of
+        # cells, and the neighbours of each cell padded to six with an extra
+        # cell that never holds a token
+        nn = n * n
+        self._low_order = np.array(sorted(range(nn), key=self._low_key.__getitem__))
+        self._high_order = np.array(sorted(range(nn), key=self._high_key.__getitem__))
+        self._low_rank = np.empty(nn + 1, dtype=int)
+        self._low_rank[self._low_order] = np.arange(nn)
+        self._high_rank = np.empty(nn + 1, dtype=int)
+        self._high_rank[self._high_order] = np.arange(nn)
+        self._scan_rank = np.array(self._scan_key + [nn])
+        self._neighbour_array = np.array([neighbours + (nn,) * (6 - len(neighbours))
+                                          for neighbours in self.neighbours])
+
+        # Chain id of each cell (0 if the cell holds no token of this colour)
+        self.label = [0] * (n * n)
+
+        # Chain id -> (cells, low endpoint, high endpoint, first scanned cell)
+        self.chains = {}
+
+        # Chain size -> set of ids of chains with that size
+        self.by_size = {}
+        self.max_size = 0
+
+        self.next_id = 1
+        self.trail = []
+
+    def _set_label(self, cell, cid):
+        self.trail.append((_LABEL, cell, self.label[cell]))
+        self.label[cell] = cid
+
+    def _add_chain(self, cells):
+        """
+        Register a new chain made of the given cells, returning its id.
+        """
+        cid = self.next_id
+        self.next_id += 1
+
+        low_key = self._low_key
+        high_key = self._high_key
+        scan_key = self._scan_key
+        low = min(cells, key=low_key.__getitem__)
+        high = min(cells, key=high_key.__getitem__)
+        first = min(cells, key=scan_key.__getitem__)
+
+        for cell in cells:
+            self._set_label(cell, cid)
+        self.trail.append((_CHAIN, cid, None))
+        self.chains[cid] = (cells, low, high, first)
+
+        size = len(cells)
+        self.by_size.setdefault(size, set()).add(cid)
+        self.trail.append((_BUCKET_ADD, size, cid))
+        if size > self.max_size:
+            self.trail.append((_MAX_SIZE, self.max_size, None))
+            self.max_size = size
+        return cid
+
+    def _remove_chain(self, cid):
+        """
+        Unregister a chain (its cells keep their label until relabelled).
+        """
+        chain = self.chains.pop(cid)
+        self.trail.append((_CHAIN, cid, chain))
+
+        size = len(chain[0])
+        bucket = self.by_size[size]
+        bucket.discard(cid)
+        self.trail.append((_BUCKET_REMOVE, size, cid))
+        if not bucket and size == self.max_size:
+            self.trail.append((_MAX_SIZE, self.max_size, None))
+            while self.max_size > 0 and not self.by_size.get(self.max_size):
+                self.max_size -= 1
+
+    def add(self, cell):
+        """
+        A token of this colour was placed on cell: merge it with the chains
+        around it.
+        """
+        label = self.label
+        merged = set(label[neighbour] for neighbour in self.neighbours[cell])
+        merged.discard(0)
+
+        cells = [cell]
+        for cid in merged:
+            cells.extend(self.chains[cid][0])
+            self._remove_chain(cid)
+        self._add_chain(cells)
+
+    def remove(self, cell):
+        """
+        A token of this colour was removed from cell: split what is left of
+        its chain into its connected pieces.
+        """
+        label = self.label
+        neighbours = self.neighbours
+        cid = label[cell]
+        cells = self.chains[cid][0]
+        self._remove_chain(cid)
+        self._set_label(cell, 0)
+
+        # Flood fill each remaining piece, relabelling it as it is found
+        for start in cells:
+            if label[start] != cid:
+                continue
+            self._set_label(start, -1)
+            piece = [start]
+            i = 0
+            while i < len(piece):
+                for neighbour in neighbours[piece[i]]:
+                    if label[neighbour] == cid:
+                        self._set_label(neighbour, -1)
+                        piece.append(neighbour)
+                i += 1
+            self._add_chain(piece)
+
+    def longest(self):
+        """
+        Returns the id of the longest chain (0 if there are no tokens).
+        """
+        if self.max_size == 0:
+            return 0
+        scan_key = self._scan_key
+        chains = self.chains
+        return min(self.by_size[self.max_size], key=lambda cid: scan_key[chains[cid][3]])
+
+    def ends(self, cid):
+        """
+        Returns the flat indices of the lowest and highest cells of a chain
+        along the player's axis (the same cell twice if they coincide).
+        """
+        _, low, high, _ = self.chains[cid]
+        return low, high
+
+    def ends_after_add(self, cell):
+        """
+        Returns the ends (as flat indices) the longest chain would have if a
+        token were placed on cell, without changing any state.
+        """
+        chains = self.chains
+        label = self.label
+        merged = set(label[neighbour] for neighbour in self.neighbours[cell])
+        merged.discard(0)
+
+        # The chain the new token would form
+        size = 1
+        low = high = first = cell
+        for cid in merged:
+            cells, chain_low, chain_high, chain_first = chains[cid]
+            size += len(cells)
+            low = min(low, chain_low, key=self._low_key.__getitem__)
+            high = min(high, chain_high, key=self._high_key.__getitem__)
+            first = min(first, chain_first, key=self._scan_key.__getitem__)
+
+        # Keep the current longest chain if it is left untouched and not beaten
+        longest = self.longest()
+        if longest != 0 and longest not in merged:
+            cells, longest_low, longest_high, longest_first = chains[longest]
+            if len(cells) > size or (len(cells) == size and
+                                     self._scan_key[longest_first] < self._scan_key[first]):
+                return longest_low, longest_high
+
+        return low, high
+
+    def ends_after_adds(self, cells):
+        """
+        Batch version of ends_after_add: returns arrays of the ends the
+        longest chain would have if a token were placed on each of the given
+        empty cells (one at a time).
+        """
+        nn = self.n * self.n
+        cells = np.asarray(cells, dtype=int)
+
+        # Chain id, size and (ranked) endpoints of the chain on every cell
+        label = np.zeros(nn + 1, dtype=int)
+        size = np.zeros(nn + 1, dtype=int)
+        low = np.full(nn + 1, nn, dtype=int)
+        high = np.full(nn + 1, nn, dtype=int)
+        first = np.full(nn + 1, nn, dtype=int)
+        for cid, (chain, chain_low, chain_high, chain_first) in self.chains.items():
+            label[chain] = cid
+            size[chain] = len(chain)
+            low[chain] = self._low_rank[chain_low]
+            high[chain] = self._high_rank[chain_high]
+            first[chain] = self._scan_rank[chain_first]
+
+        # The chains around each cell, counting a chain met twice once
+        around = self._neighbour_array[cells]
+        merged = label[around]
+        for i in range(1, 6):
+            seen = (merged[:, i:i + 1] == merged[:, :i]).any(axis=1)
+            around[seen, i] = nn
+            merged[seen, i] = 0
+
+        # The chain each new token would form
+        new_size = 1 + size[around].sum(axis=1)
+        new_low = np.minimum(self._low_rank[cells], low[around].min(axis=1))
+        new_high = np.minimum(self._high_rank[cells], high[around].min(axis=1))
+        new_first = np.minimum(self._scan_rank[cells], first[around].min(axis=1))
+        lows = self._low_order[new_low]
+        highs = self._high_order[new_high]
+
+        # Keep the current longest chain if it is left untouched and not beaten
+        longest = self.longest()
+        if longest != 0:
+            chain, longest_low, longest_high, longest_first = self.chains[longest]
+            keep = ~(merged == longest).any(axis=1) & (
+                (len(chain) > new_size) |
+                ((len(chain) == new_size) & (self._scan_rank[longest_first] < new_first)))
+            lows = np.where(keep, longest_low, lows)
+            highs = np.where(keep, longest_high, highs)
+
+        return lows, highs
+
+    def chain_coords(self, cid):
+        """
+        Returns the (r, q) coordinates of the cells in a chain.
+        """
+        coords = self.coords
+        return [coords[cell] for cell in self.chains[cid][0]]
+
+    def endpoints(self, cid):
+        """
+        Returns the coordinates of the lowest and highest cells of a chain
+        along the player's axis (a single coordinate if they coincide).
+        """
+        _, low, high, _ = self.chains[cid]
+        if low == high:
+            return [self.coords[low]]
+        return [self.coords[low], self.coords[high]]
+
+    def mark(self):
+        """
+        Returns a marker for the current state, to later pass to undo.
+        """
+        return len(self.trail)
+
+    def undo(self, mark):
+        """
+        Restore the state the tracker was in when mark was taken.
+        """
+        trail = self.trail
+        while len(trail) > mark:
+            kind, a, b = trail.pop()
+            if kind == _LABEL:
+                self.label[a] = b
+            elif kind == _CHAIN:
+                if b is None:
+                    del self.chains[a]
+                else:
+                    self.chains[a] = b
+            elif kind == _BUCKET_ADD:
+                self.by_size[a].discard(b)
+            elif kind == _BUCKET_REMOVE:
+                self.by_size[a].add(b)
+            else:
+                self.max_size = a
+
+    def clear_trail(self):
+        """
+        Forget recorded changes (once they can no longer be undone).
+        """
+        self.trail.clear()
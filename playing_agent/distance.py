@@ -0,0 +1,333 @@
+"""
+Incrementally maintained shortest path distances from an edge of the board.
+
+A DistanceMap holds, for every cell, the cost of the cheapest path from one
+edge of the board to that cell, where entering a cell costs an amount that
+depends on the token it holds (e.g. free for empty cells, impassable for
+the opponent's tokens). When a single cell changes, only the region of the
+shortest path tree whose distances depend on it is repaired. Every change is
+recorded on a trail so that hypothetical moves can be undone in time
+proportional to the work they caused.
+
+Paths also take virtual connections: the two ends of a bridge (cells two
+steps apart with two carrier cells between them) are linked like adjacent
+cells, and a cell in the second row from the edge whose two edge neighbours
+are its carriers (edge template II) is entered straight from the edge. A
+virtual connection holds as long as neither of its carriers is impassable,
+since the other carrier is always left to complete it.
+"""
+
+from heapq import heappush, heappop
+
+from playing_agent.geometry import neighbour_table, bridge_table
+
+# Distance of cells that cannot be reached from the edge (and cost of
+# cells that cannot be entered)
+INF = 1 << 30
+
+# Caches of edge layouts, keyed by board size and edge cells, and of
+# distances on the empty board, keyed also by the cost of empty cells
+_LAYOUTS = {}
+_EMPTY_BOARDS = {}
+
+
+def _layout(n, sources):
+    """
+    Returns the tables describing the edge made of the given cells on a
+    board of size n: whether each cell is on the edge, the carriers of each
+    cell entered straight from the edge (or None) by an edge template, the
+    cells each edge cell carries, and the bridges carried by each cell, as
+    (end, other end) pairs in both directions.
+    """
+    neighbours = neighbour_table(n)
+    is_source = [False] * (n * n)
+    for source in sources:
+        is_source[source] = True
+
+    templates = [None] * (n * n)
+    carried_templates = [[] for _ in range(n * n)]
+    for cell in range(n * n):
+        below = [neighbour for neighbour in neighbours[cell] if is_source[neighbour]]
+        if not is_source[cell] and len(below) == 2:
+            templates[cell] = tuple(below)
+            for carrier in below:
+                carried_templates[carrier].append(cell)
+
+    carried_bridges = [[] for _ in range(n * n)]
+    for cell, bridges in enumerate(bridge_table(n)):
+        for end, carrier1, carrier2 in bridges:
+            carried_bridges[carrier1].append((cell, end))
+            carried_bridges[carrier2].append((cell, end))
+    return is_source, templates, carried_templates, carried_bridges
+
+
+class DistanceMap:
+
+    def __init__(self, n, sources, token_costs):
+        """
+        Create the distance map for an empty board of size n. The sources are
+        the flat indices of the edge cells paths start from, and token_costs
+        maps each token type to the cost of entering a cell holding it.
+        """
+        self.n = n
+        self.token_costs = token_costs
+        self.sources = list(sources)
+        self.neighbours = neighbour_table(n)
+        self.bridges = bridge_table(n)
+
+        # Tables that only depend on the board size and edge are built once
+        # and shared by every map of that edge
+        layout_key = (n, tuple(self.sources))
+        layout = _LAYOUTS.get(layout_key)
+        if layout is None:
+            layout = _LAYOUTS[layout_key] = _layout(n, self.sources)
+        self.is_source, self.templates, self.carried_templates, self.carried_bridges = layout
+
+        self.cost = [token_costs[0]] * (n * n)
+
+        # Record of (cell, dist, parent, cost) values overwritten since the
+        # trail was last cleared
+        self.trail = []
+
+        # Distances on the empty board are copied from the first map built
+        # with the same edge and cost of empty cells
+        empty_key = layout_key + (token_costs[0],)
+        empty = _EMPTY_BOARDS.get(empty_key)
+        if empty is None:
+            self.dist = [INF] * (n * n)
+            self.parent = [-1] * (n * n)
+            self._rebuild()
+            _EMPTY_BOARDS[empty_key] = (tuple(self.dist), tuple(self.parent))
+        else:
+            self.dist = list(empty[0])
+            self.parent = list(empty[1])
+
+    def _rebuild(self):
+        """
+        Compute all distances from scratch.
+        """
+        cost = self.cost
+        dist = self.dist
+        queue = []
+        for cell in range(self.n * self.n):
+            if self._is_entry(cell) and cost[cell] < INF:
+                dist[cell] = cost[cell]
+                heappush(queue, (cost[cell], cell))
+        self._propagate(queue)
+
+    def _is_entry(self, cell):
+        """
+        True iff paths can start at cell: it lies on the edge, or is joined
+        to it by an edge template whose carriers can be entered.
+        """
+        if self.is_source[cell]:
+            return True
+        template = self.templates[cell]
+        return template is not None and self.cost[template[0]] < INF and self.cost[template[1]] < INF
+
+    def _propagate(self, queue):
+        """
+        Dijkstra's algorithm from the (distance, cell) entries in queue,
+        lowering the distance of any cell a cheaper path is found to.
+        """
+        neighbours = self.neighbours
+        bridges = self.bridges
+        cost = self.cost
+        dist = self.dist
+        parent = self.parent
+        trail = self.trail
+
+        while queue:
+            d, curr = heappop(queue)
+            if d != dist[curr]:
+                continue
+            for neighbour in neighbours[curr]:
+                new_dist = d + cost[neighbour]
+                if new_dist < dist[neighbour]:
+                    trail.append((neighbour, dist[neighbour], parent[neighbour], cost[neighbour]))
+                    dist[neighbour] = new_dist
+                    parent[neighbour] = curr
+                    heappush(queue, (new_dist, neighbour))
+            for end, carrier1, carrier2 in bridges[curr]:
+                new_dist = d + cost[end]
+                if new_dist < dist[end] and cost[carrier1] < INF and cost[carrier2] < INF:
+                    trail.append((end, dist[end], parent[end], cost[end]))
+                    dist[end] = new_dist
+                    parent[end] = curr
+                    heappush(queue, (new_dist, end))
+
+    def update(self, cell, token):
+        """
+        Repair the distances after the token held by cell has changed.
+        """
+        new_cost = self.token_costs[token]
+        old_cost = self.cost[cell]
+        if new_cost < old_cost:
+            self._decrease(cell, new_cost)
+            if old_cost >= INF:
+                # The virtual connections cell carries may hold again
+                self._relax([end for _, end in self.carried_bridges[cell]] +
+                            self.carried_templates[cell])
+        elif new_cost > old_cost:
+            roots = [cell]
+            if new_cost >= INF:
+                # Cells entered through a virtual connection cell carries
+                # have to find another way in
+                parent = self.parent
+                roots += [end for start, end in self.carried_bridges[cell] if parent[end] == start]
+                roots += [end for end in self.carried_templates[cell] if parent[end] == -1]
+            self._increase(cell, new_cost, roots)
+
+    def _best_entry(self, cell):
+        """
+        Returns the lowest (distance, parent) pair for cell given the current
+        distances of its neighbours.
+        """
+        dist = self.dist
+        cost = self.cost
+        c = cost[cell]
+        if c >= INF:
+            return INF, -1
+        best, best_parent = (c, -1) if self._is_entry(cell) else (INF, -1)
+        for neighbour in self.neighbours[cell]:
+            if dist[neighbour] + c < best:
+                best = dist[neighbour] + c
+                best_parent = neighbour
+        for end, carrier1, carrier2 in self.bridges[cell]:
+            if dist[end] + c < best and cost[carrier1] < INF and cost[carrier2] < INF:
+                best = dist[end] + c
+                best_parent = end
+        return best, best_parent
+
+    def _decrease(self, cell, new_cost):
+        """
+        Entering cell became cheaper: distances can only go down, so grow
+        the improvement outwards from cell.
+        """
+        self.trail.append((cell, self.dist[cell], self.parent[cell], self.cost[cell]))
+        self.cost[cell] = new_cost
+        self._relax([cell])
+
+    def _relax(self, cells):
+        """
+        Lower the distances of cells that can now be entered more cheaply,
+        and grow the improvements outwards.
+        """
+        dist = self.dist
+        parent = self.parent
+        trail = self.trail
+        queue = []
+        for cell in cells:
+            best, best_parent = self._best_entry(cell)
+            if best < dist[cell]:
+                trail.append((cell, dist[cell], parent[cell], self.cost[cell]))
+                dist[cell] = best
+                parent[cell] = best_parent
+                queue.append((best, cell))
+        queue.sort()
+        self._propagate(queue)
+
+    def _increase(self, cell, new_cost, roots):
+        """
+        Entering cell became more expensive: only cells whose shortest path
+        runs through one of the roots (cell, and any cell entered through a
+        virtual connection that no longer holds) can get further away.
+        Reset their subtrees in the shortest path tree and recompute them
+        from their border.
+        """
+        neighbours = self.neighbours
+        bridges = self.bridges
+        dist = self.dist
+        parent = self.parent
+        cost = self.cost
+        trail = self.trail
+
+        trail.append((cell, dist[cell], parent[cell], cost[cell]))
+        cost[cell] = new_cost
+
+        # Collect the subtrees rooted at the roots
+        affected = []
+        seen = set()
+        for root in roots:
+            if root not in seen and (root == cell or dist[root] < INF):
+                seen.add(root)
+                affected.append(root)
+        i = 0
+        while i < len(affected):
+            curr = affected[i]
+            if dist[curr] < INF:
+                for neighbour in neighbours[curr]:
+                    if parent[neighbour] == curr and dist[neighbour] < INF and neighbour not in seen:
+                        seen.add(neighbour)
+                        affected.append(neighbour)
+                for end, _, _ in bridges[curr]:
+                    if parent[end] == curr and dist[end] < INF and end not in seen:
+                        seen.add(end)
+                        affected.append(end)
+            i += 1
+
+        for curr in affected:
+            if curr != cell:
+                trail.append((curr, dist[curr], parent[curr], cost[curr]))
+            dist[curr] = INF
+            parent[curr] = -1
+
+        # Re-enter the subtree from its unaffected surroundings
+        queue = []
+        for curr in affected:
+            best, best_parent = self._best_entry(curr)
+            if best < INF:
+                dist[curr] = best
+                parent[curr] = best_parent
+                queue.append((best, curr))
+        queue.sort()
+        self._propagate(queue)
+
+    def path_cells(self, cell):
+        """
+        Returns the cells a shortest path from the edge to cell depends on:
+        the cells along it, and the carriers of the virtual connections it
+        takes.
+        """
+        cells = []
+        parent = self.parent
+        neighbours = self.neighbours
+        while cell != -1:
+            cells.append(cell)
+            prev = parent[cell]
+            if prev == -1:
+                if not self.is_source[cell] and self.templates[cell] is not None:
+                    cells.extend(self.templates[cell])
+            elif prev not in neighbours[cell]:
+                for end, carrier1, carrier2 in self.bridges[cell]:
+                    if end == prev:
+                        cells.append(carrier1)
+                        cells.append(carrier2)
+            cell = prev
+        return cells
+
+    def mark(self):
+        """
+        Returns a marker for the current state, to later pass to undo.
+        """
+        return len(self.trail)
+
+    def undo(self, mark):
+        """
+        Restore the state the map was in when mark was taken.
+        """
+        trail = self.trail
+        dist = self.dist
+        parent = self.parent
+        cost = self.cost
+        while len(trail) > mark:
+            cell, d, p, c = trail.pop()
+            dist[cell] = d
+            parent[cell] = p
+            cost[cell] = c
+
+    def clear_trail(self):
+        """
+        Forget recorded changes (once they can no longer be undone).
+        """
+        self.trail.clear()
@@ -0,0 +1,129 @@
+"""
+Precomputed board geometry for the playing agent.
+
+Cells are addressed by a flat index `r * n + q` (in the same (r, q)
+coordinates the referee uses), so that per-cell data can be kept in plain
+lists instead of dictionaries keyed by coordinate tuples. Tables only depend
+on the board size, so they are built once per n and shared between players.
+"""
+
+# Neighbour hex steps in clockwise order (taken from the 'referee' module)
+HEX_STEPS = ((1, -1), (1, 0), (0, 1), (-1, 1), (-1, 0), (0, -1))
+
+# Cache of geometry tables, keyed by board size
+_COORDS = {}
+_NEIGHBOURS = {}
+_HEURISTICS = {}
+_CAPTURES = {}
+_BRIDGES = {}
+_CAPTURE_MIDS = {}
+
+# Diamond capture patterns as (opposite step, neighbour 1 step, neighbour 2
+# step), for "longways" (adjacent neighbours) and "sideways" (neighbours
+# spaced apart) diamonds (taken from the 'referee' module)
+CAPTURE_STEPS = tuple(
+    ((a[0] + b[0], a[1] + b[1]), a, b)
+    for roll in (1, 2)
+    for a, b in zip(HEX_STEPS, HEX_STEPS[-roll:] + HEX_STEPS[:-roll]))
+
+
+def flat_coords(n):
+    """
+    Returns the list mapping each flat index to its (r, q) coordinate.
+    """
+    coords = _COORDS.get(n)
+    if coords is None:
+        coords = [(r, q) for r in range(n) for q in range(n)]
+        _COORDS[n] = coords
+    return coords
+
+
+def neighbour_table(n):
+    """
+    Returns, for each flat index, a tuple of the flat indices of its
+    within-bounds neighbours (in the same clockwise order as HEX_STEPS).
+    """
+    table = _NEIGHBOURS.get(n)
+    if table is None:
+        table = []
+        for r, q in flat_coords(n):
+            table.append(tuple((r + dr) * n + (q + dq) for dr, dq in HEX_STEPS
+                               if 0 <= r + dr < n and 0 <= q + dq < n))
+        _NEIGHBOURS[n] = table
+    return table
+
+
+def heuristic_table(n, goal_coord):
+    """
+    Returns the axial distance from every cell to goal_coord, indexed by
+    flat index. The goal does not need to be inside the board.
+    """
+    key = (n, goal_coord)
+    table = _HEURISTICS.get(key)
+    if table is None:
+        (b_r, b_q) = goal_coord
+        table = [(abs(a_q - b_q) + abs(a_q + a_r - b_q - b_r) + abs(a_r - b_r)) / 2
+                 for a_r, a_q in flat_coords(n)]
+        _HEURISTICS[key] = table
+    return table
+
+
+def _diamonds(n, steps):
+    """
+    Returns, for each flat index, a tuple of the diamonds with a corner on
+    it, as flat index triples at the offsets of each (step, step, step) in
+    steps. Only diamonds lying fully inside the board are included.
+    """
+    table = []
+    for r, q in flat_coords(n):
+        diamonds = []
+        for (r1, q1), (r2, q2), (r3, q3) in steps:
+            a, b, c = r + r1, r + r2, r + r3
+            d, e, f = q + q1, q + q2, q + q3
+            if 0 <= a < n and 0 <= b < n and 0 <= c < n and 0 <= d < n and 0 <= e < n and 0 <= f < n:
+                diamonds.append((a * n + d, b * n + e, c * n + f))
+        table.append(tuple(diamonds))
+    return table
+
+
+def capture_table(n):
+    """
+    Returns, for each flat index, a tuple of the diamonds it is a corner of,
+    as (opposite corner, middle cell, middle cell) flat index triples. Only
+    diamonds lying fully inside the board are included.
+    """
+    table = _CAPTURES.get(n)
+    if table is None:
+        table = _CAPTURES[n] = _diamonds(n, CAPTURE_STEPS)
+    return table
+
+
+def bridge_table(n):
+    """
+    Returns, for each flat index, a tuple of the bridges it is an end of, as
+    (other end, carrier, carrier) flat index triples: the far corner of a
+    "longways" diamond and the two cells between them. Only bridges lying
+    fully inside the board are included.
+    """
+    table = _BRIDGES.get(n)
+    if table is None:
+        table = _BRIDGES[n] = _diamonds(n, CAPTURE_STEPS[:len(HEX_STEPS)])
+    return table
+
+
+def capture_mid_table(n):
+    """
+    Returns, for each flat index, a tuple of the diamonds it is a middle
+    cell of, as (corner, opposite corner, other middle cell) flat index
+    triples. Each diamond is listed once for each of its corners.
+    """
+    table = _CAPTURE_MIDS.get(n)
+    if table is None:
+        mids = [[] for _ in range(n * n)]
+        for corner, patterns in enumerate(capture_table(n)):
+            for opposite, mid1, mid2 in patterns:
+                mids[mid1].append((corner, opposite, mid2))
+                mids[mid2].append((corner, opposite, mid1))
+        table = [tuple(diamonds) for diamonds in mids]
+        _CAPTURE_MIDS[n] = table
+    return table
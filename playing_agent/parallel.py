@@ -0,0 +1,110 @@
+"""
+Root-parallel search for the playing agent.
+
+A RootSearchPool forks a fixed set of worker processes (see the workers
+module) once, when the player is created, and keeps them for the whole game.
+Each worker holds its own replica of the player, brought up to date by
+replaying the actions of the game, and searches whole root moves. Workers
+share the best root score found so far, so every root move is searched with
+the tightest alpha bound available when it starts.
+"""
+
+import multiprocessing
+
+from collections import deque
+from math import inf
+
+from playing_agent.workers import Worker, finished
+
+# Shared alpha value meaning "no root move has been searched yet"
+_NO_ALPHA = -(1 << 62)
+
+# Per-worker state (set up by _init_worker in each worker process)
+_replica = None
+_shared_alpha = None
+
+
+def _init_worker(colour, n, shared_alpha):
+    """
+    Create the worker's replica of the player.
+    """
+    global _replica, _shared_alpha
+
+    from playing_agent.player import Player
+    _replica = Player(colour, n, workers=0, ponder=False, stats=False)
+    _shared_alpha = shared_alpha
+
+
+def _search_root_move(history, index, move, depth):
+    """
+    Search one root move on the worker's replica, returning its score.
+    """
+    # Catch up with the actual game
+    for player, action in history[len(_replica.history):]:
+        _replica.turn(player, action)
+
+    # Search one below the best score so far, so that a move tying with it
+    # still gets an exact score (and ties are broken as in a serial search)
+    alpha = _shared_alpha.value
+    alpha = -inf if alpha == _NO_ALPHA else alpha - 1
+    score = _replica.search_root_move(move, alpha, depth)
+
+    with _shared_alpha.get_lock():
+        if score > _shared_alpha.value:
+            _shared_alpha.value = score
+
+    return index, move, score
+
+
+class RootSearchPool:
+
+    def __init__(self, colour, n, workers):
+        """
+        Fork the given number of worker processes for a player of the given
+        colour on a board of size n.
+        """
+        context = multiprocessing.get_context("fork")
+        self.shared_alpha = context.Value("q", _NO_ALPHA)
+        self.workers = [Worker(_init_worker, (colour, n, self.shared_alpha))
+                        for _ in range(workers)]
+
+    @property
+    def cpu_time(self):
+        """
+        Total CPU time used by the workers (not seen by the referee).
+        """
+        return sum(worker.cpu_time for worker in self.workers)
+
+    def best_moves(self, history, moves, depth):
+        """
+        Search every root move in moves on the position reached by history,
+        returning the best score and the moves that reach it, in the order
+        of moves (as a serial search would).
+        """
+        with self.shared_alpha.get_lock():
+            self.shared_alpha.value = _NO_ALPHA
+
+        # Hand the moves out in order, one to each worker as it comes free
+        best_score, best_indices = -inf, []
+        tasks = deque(enumerate(moves))
+        idle = list(self.workers)
+        while tasks or len(idle) < len(self.workers):
+            while tasks and idle:
+                index, move = tasks.popleft()
+                idle.pop().submit(_search_root_move, history, index, move, depth)
+            for worker in finished(self.workers):
+                index, move, score = worker.result()
+                idle.append(worker)
+                if score > best_score:
+                    best_score, best_indices = score, []
+                if score == best_score:
+                    best_indices.append(index)
+
+        return best_score, [moves[index] for index in sorted(best_indices)]
+
+    def close(self):
+        """
+        Stop the worker processes.
+        """
+        for worker in self.workers:
+            worker.close()
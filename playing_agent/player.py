@@ -1,11 +1,22 @@
+import os
 import time
-import gc
 
-from numpy import zeros, array, roll, vectorize
+from numpy import zeros, array, roll, flatnonzero, uint8, where
 from random import randint
-from queue import Queue, PriorityQueue
+from collections import deque
+from heapq import heappush, heappop
 from math import inf
 
+from playing_agent.geometry import flat_coords, neighbour_table, heuristic_table, capture_mid_table
+from playing_agent.distance import DistanceMap, INF
+from playing_agent.chains import ChainTracker
+from playing_agent.rollout import BatchRollout
+from playing_agent.threats import ThreatMaps
+from playing_agent.book import OpeningBook, STEAL
+from playing_agent.proof import ProofSearch, UNKNOWN
+from playing_agent.zobrist import zobrist_table
+from playing_agent.cache import EvalCache
+
 # Action types (taken from 'referee' module)
 _ACTION_PLACE = "PLACE"
 _ACTION_STEAL = "STEAL"
@@ -19,6 +30,7 @@ _PLAYER_AXIS = {
 # Players
 RED = "red"
 BLUE = "blue"
+_OPPONENT = {RED: BLUE, BLUE: RED}
 
 # Utility function to add two coord tuples (taken from the 'referee' module)
 _ADD = lambda a, b: (a[0] + b[0], a[1] + b[1])
@@ -39,17 +51,117 @@ _TOKEN_MAP_IN = {v: k for k, v in _TOKEN_MAP_OUT.items()}
 # Map between player token types (taken from the 'referee' module)
 _SWAP_PLAYER = {0: 0, 1: 2, 2: 1}
 
+# Number of turns after which the game is drawn (taken from the 'referee' module)
+_MAX_TURNS = 343
+
+# Depth of the minimax search, in plies (including the root move)
+_SEARCH_DEPTH = 4
+
+# Maximum number of plies of captures (and replies to them) searched past
+# the minimax horizon
+_QUIESCENCE_DEPTH = 4
+
+# Score of a won position, and connection distance of a chain that is cut
+# off from one of its borders
+_WIN_SCORE = 100000
+_UNREACHABLE = 1000
+
+# Candidate moves whose best connection (for either player) is more than this
+# much longer than that player's shortest connection are pruned
+_PATH_SLACK = 1
+
+# Connection distance (of either player) from which positions are handed to
+# the proof-number search, and the number of nodes it may search (about a
+# few hundredths of a second)
+_PROOF_DISTANCE = 1
+_PROOF_NODES = 5000
+
+# Number of worker processes used to search root moves in parallel (0 to
+# search in this process only). Worker CPU time is not seen by the referee's
+# timer, so parallel search is off unless asked for
+_WORKERS = int(os.environ.get("PLAYING_AGENT_WORKERS", 0))
+
+# Whether to search on the opponent's time, in a worker process (off unless
+# asked for, for the same reason)
+_PONDER = os.environ.get("PLAYING_AGENT_PONDER", "") not in ("", "0")
+
+# Memory budget of the evaluation cache, in bytes (0 to evaluate every
+# position afresh)
+_EVAL_CACHE_BYTES = int(os.environ.get("PLAYING_AGENT_EVAL_CACHE", 8 << 20))
+
+# Number of random playouts (run as one batch) after each root move that the
+# search scores the same as the best, to choose between them (0 to play the
+# first of them searched)
+_PLAYOUTS = int(os.environ.get("PLAYING_AGENT_PLAYOUTS", 256))
+
+# Where to write per-move search statistics: "" for nowhere, "1" or "-" for
+# stderr, or the path of a file (see the stats module)
+_STATS = os.environ.get("PLAYING_AGENT_STATS", "")
+
+
+class SearchAborted(Exception):
+    """
+    Raised inside a search that has been cancelled from another process
+    """
+
+
+class EvalContext:
+    """
+    Facts about a position, for the player about to move, that are shared by
+    move generation and by the evaluation of each of its child positions
+    """
+    __slots__ = ("opp", "opp_chain", "block_moves", "block_set", "opp_distance", "opp_path_cells",
+                 "capture_cells", "threat_cells", "bridge_cells", "repair_cells", "connections")
+
+    def __init__(self, opp, opp_chain, block_moves, opp_distance, opp_path_cells,
+                 capture_cells, threat_cells, bridge_cells, repair_cells, connections):
+        self.opp = opp
+        self.opp_chain = opp_chain
+        self.block_moves = block_moves
+        self.block_set = set(block_moves)
+
+        # Connection distance of the opponent, and the cells its shortest
+        # paths to its borders run through (None if any cell could matter)
+        self.opp_distance = opp_distance
+        self.opp_path_cells = opp_path_cells
+
+        # Empty cells (as flat indices) where a token would capture, where
+        # one of the opponent's would, where it would split one of the
+        # opponent's bridges, and where it would save one of the player's
+        # own bridges from an intrusion
+        self.capture_cells = capture_cells
+        self.threat_cells = threat_cells
+        self.bridge_cells = bridge_cells
+        self.repair_cells = repair_cells
+
+        # The distance maps of each player with the length of its shortest
+        # connection, to tell how far a cell is from being on one
+        self.connections = connections
+
 
 class Player:
 
-    def __init__(self, player, n):
+    def __init__(self, player, n, workers=None, ordering=True, playouts=None, ponder=None,
+                 eval_cache=None, stats=None):
         """
         Called once at the beginning of a game to initialise this player.
         Set up an internal representation of the game state.
 
         The parameter player is the string "red" if the player will
         play as Red, or the string "blue" if the player will play
-        as Blue.
+        as Blue. The optional parameter workers is the number of processes
+        to search with (by default taken from PLAYING_AGENT_WORKERS), and
+        ordering can be set to False to search moves without the killer move
+        and history heuristics. The optional parameter playouts is the number
+        of random playouts that choose between root moves the search scores
+        the same (by default taken from PLAYING_AGENT_PLAYOUTS). The
+        optional parameter ponder sets whether to search on the opponent's
+        time (by default taken from PLAYING_AGENT_PONDER), and eval_cache is
+        the memory budget of the evaluation cache in bytes (by default taken
+        from PLAYING_AGENT_EVAL_CACHE). The optional parameter stats is where to
+        write search statistics for every action ("1" or "-" for stderr, a
+        file path, or False for nowhere; by default taken from
+        PLAYING_AGENT_STATS).
         """
 
         self.player = player
@@ -60,19 +172,168 @@ class Player:
         self.n = n
         self.n_turns = 1
         self.ub = self.n - 1
-        self._data = zeros((n, n), dtype=int)
-        self.all_coords = self.enum_coords(n)
-        self.border_coords = {"red": [coord for coord in self.all_coords if (coord[0] == 0 or coord[0] == n - 1)],
-                              "blue": [coord for coord in self.all_coords if (coord[1] == 0 or coord[1] == n - 1)]}
-        self.occ_coords = []
+
+        # The board, as the token on each flat index (r * n + q), and the
+        # precomputed geometry used by the path finding routines
+        self._cells = [0] * (n * n)
+        self._coords = flat_coords(n)
+
+        # Flat indices of each player's border cells, in board order
+        self._border_cells = {colour: tuple(idx for idx, coord in enumerate(self._coords)
+                                            if coord[axis] in (0, n - 1))
+                              for colour, axis in _PLAYER_AXIS.items()}
+        self._neighbours = neighbour_table(n)
+        self._capture_mids = capture_mid_table(n)
+
+        # Preallocated A* cost and parent arrays. Entries are only valid when
+        # their generation stamp matches the current search generation, so
+        # the arrays never need to be cleared between searches
+        self._g = [0] * (n * n)
+        self._parent = [0] * (n * n)
+        self._open_gen = [0] * (n * n)
+        self._closed_gen = [0] * (n * n)
+        self._search_gen = 0
+
+        # Distances from each player's two borders (low and high axis value)
+        # to every cell, counting every cell the player can pass through.
+        # These are repaired incrementally as tokens are placed and removed
+        self.dist_maps = {}
+        for colour, axis in _PLAYER_AXIS.items():
+            token = _TOKEN_MAP_IN[colour]
+            costs = {0: 1, token: 1, _SWAP_PLAYER[token]: INF}
+            self.dist_maps[colour] = tuple(
+                DistanceMap(n, [r * n + q for (r, q) in self._coords if (r, q)[axis] == side], costs)
+                for side in (0, n - 1))
+        self._all_dist_maps = [dmap for maps in self.dist_maps.values() for dmap in maps]
+
+        # Chains of each player's tokens, also kept up to date incrementally
+        self.chains = {colour: ChainTracker(n, axis) for colour, axis in _PLAYER_AXIS.items()}
+
+        # Every structure that has to be rolled back when a move is undone
+        self._incremental = self._all_dist_maps + list(self.chains.values())
+
+        # Hypothetical moves made during the search, to be undone in order
+        self._undo_stack = []
+
+        # Zobrist key of the board (see the zobrist module), kept up to date
+        # as tokens are set
+        self._zobrist, _ = zobrist_table(n)
+        self._key = 0
+
+        # Actions of the game so far, as (player, action) pairs
+        self.history = []
+
+        # Worker processes for parallel search, forked now so they can be
+        # reused for the whole game
+        if workers is None:
+            workers = _WORKERS
+        self.pool = None
+        if workers > 0:
+            # Imported here, as multiprocessing is only needed when asked for
+            from playing_agent.parallel import RootSearchPool
+            self.pool = RootSearchPool(player, n, workers)
+
+        # Worker process searching on the opponent's time, and the flag that
+        # cancels this player's own search (set on the pondering replicas)
+        if ponder is None:
+            ponder = _PONDER
+        self.ponderer = None
+        if ponder:
+            from playing_agent.ponder import Ponderer
+            self.ponderer = Ponderer(player, n)
+        self.abort = None
+
+        # Opening book for this board size (None if there is none)
+        self.book = OpeningBook.load(n)
+
+        # Move ordering: the last two moves to cause a cutoff at each number
+        # of plies left (killer moves), and a cutoff score for every cell
+        # that decays between searches. Both are kept from turn to turn
+        self.ordering = ordering
+        self.killers = [[] for _ in range(_SEARCH_DEPTH + 1)]
+        self.cutoff_history = [0] * (n * n)
+
+        # Playouts choosing between equally scored root moves (the engine is
+        # created when first used, with a fixed seed so that games can be
+        # replayed)
+        if playouts is None:
+            playouts = _PLAYOUTS
+        self.playouts = playouts
+        self.rollout = None
+
+        # Search statistics over the whole game: nodes searched, cutoffs,
+        # and cutoffs caused by the first move searched
+        self.nodes = 0
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+
+        # Further statistics over the whole game: positions evaluated, A*
+        # searches and the cells they expanded, cutoffs by the index of the
+        # move that caused them, and searches made
+        self.evals = 0
+        self.astar_calls = 0
+        self.astar_expansions = 0
+        self.cutoff_indices = []
+        self.searches = 0
+
+        # Results of the latest search: the CPU time taken by each depth
+        # searched, and the principal variation (built up from the best line
+        # found below each node, by plies left, and kept for each best root
+        # move until playouts have chosen between them)
+        self.search_score = None
+        self.depth_times = []
+        self.pv = []
+        self.pv_by_move = {}
+        self.pv_lines = [[] for _ in range(_SEARCH_DEPTH + 1)]
+
+        # Per-move statistics output (None if not asked for)
+        if stats is None:
+            stats = _STATS
+        self.stats = None
+        if stats:
+            from playing_agent.stats import SearchStats
+            self.stats = SearchStats(stats)
+
+        # Scores of evaluated positions, keyed by their Zobrist key
+        if eval_cache is None:
+            eval_cache = _EVAL_CACHE_BYTES
+        self.eval_cache = EvalCache(eval_cache) if eval_cache > 0 else None
+
+        # Proof-number search for forced wins late in the game (created when
+        # first used), and the connection distances of the player and its
+        # opponent when it last failed to settle a position (None if it has
+        # not)
+        self.proof = None
+        self.unproven = None
 
     def action(self):
         """
         Called at the beginning of the turn. Based on the current state
         of the game, select an action to play.
         """
+        if self.stats is None:
+            return self.choose_action()
+        self.stats.begin(self)
+        action = self.choose_action()
+        self.stats.end(self, action)
+        return action
+
+    def choose_action(self):
+        """
+        Select an action to play in the current state of the game
+        """
 
         valid_move = False
+        self.search_score = None
+
+        # Play from the opening book while the game is still covered by it
+        if self.book is not None and self.n_turns <= self.book.plies:
+            move = self.book.lookup(self._cells, _TOKEN_MAP_IN[self.original_player])
+            if move == STEAL:
+                return (_ACTION_STEAL,)
+            if move is not None and self._cells[move] == 0:
+                r, q = self._coords[move]
+                return (_ACTION_PLACE, r, q)
 
         if self.n_turns == 1:
 
@@ -91,13 +352,7 @@ class Player:
             return (_ACTION_STEAL,)
 
         # Check if no piece on the board
-        piece_found = False
-        for i in range(self.n):
-            for j in range(self.n):
-                if self.get_token((i, j)) == _TOKEN_MAP_IN[self.player]:
-                    piece_found = True
-
-        if piece_found == False:
+        if self.chains[self.player].max_size == 0:
 
             # Select a corner if possible
             if self.get_token((0, 0)) == 0:
@@ -112,20 +367,42 @@ class Player:
                 # Select a random move
                 while valid_move == False:
                     x = randint(0, self.ub)
-                    aX = self.axial_x(x)
                     y = randint(0, self.ub)
-                    if self._data[aX][y] == 0:
+                    if self.get_token((x, y)) == 0:
 
                         # Cannot place token in the center if it is the first turn of the game (and the board size is odd)
-                        if self.n % 2 == 1 and self.n_turns == 1 and aX * 2 == y * 2 == self.n - 1:
+                        if self.n % 2 == 1 and self.n_turns == 1 and x * 2 == y * 2 == self.n - 1:
                             valid_move = False
                         else:
                             valid_move = True
                 self.stolen = False
                 return (_ACTION_PLACE, x, y)
 
-        maxChain, maxChainEnds = self.find_longest_chain()
-        bestScore, move = self.make_best_move()
+        # Once either player is a move from connecting, play proven wins at
+        # once, and the longest defence in proven losses. A position the
+        # search cannot settle is not searched again until either player has
+        # come closer to connecting
+        distances = (self.connection_distance(self.original_player),
+                     self.connection_distance(_OPPONENT[self.original_player]))
+        if min(distances) <= _PROOF_DISTANCE and (
+                self.unproven is None or any(map(int.__lt__, distances, self.unproven))):
+            if self.proof is None:
+                self.proof = ProofSearch(self.n)
+            result, cell = self.proof.search(self._cells, _TOKEN_MAP_IN[self.original_player], _PROOF_NODES,
+                                             self.abort)
+            self.unproven = distances if result == UNKNOWN else None
+            if result != UNKNOWN and cell != STEAL:
+                r, q = self._coords[cell]
+                return (_ACTION_PLACE, r, q)
+
+        # Take the answer searched on the opponent's time if it predicted the
+        # opponent's move, and search now otherwise
+        pondered = self.ponderer.result(self.history) if self.ponderer is not None else None
+        if pondered is not None:
+            bestScore, move = pondered
+        else:
+            bestScore, move = self.make_best_move()
+        self.search_score = bestScore
 
         if move == None or self.get_token(move) != 0:
             # Select a corner if possible
@@ -141,33 +418,18 @@ class Player:
                 # Select a random move
                 while valid_move == False:
                     x = randint(0, self.ub)
-                    aX = self.axial_x(x)
                     y = randint(0, self.ub)
-                    if self._data[aX][y] == 0:
+                    if self.get_token((x, y)) == 0:
 
                         # Cannot place token in the center if it is the first turn of the game (and the board size is odd)
-                        if self.n % 2 == 1 and self.n_turns == 1 and aX * 2 == y * 2 == self.n - 1:
+                        if self.n % 2 == 1 and self.n_turns == 1 and x * 2 == y * 2 == self.n - 1:
                             valid_move = False
                         else:
                             valid_move = True
                 self.stolen = False
                 return (_ACTION_PLACE, x, y)
 
-        # Select a random move if identified best move is invalid
-        if self.get_token(move) == 0:
-            while valid_move == False:
-                x = randint(0, self.ub)
-                aX = self.axial_x(x)
-                y = randint(0, self.ub)
-                if self._data[aX][y] == 0:
-
-                    # Cannot place token in the center if it is the first turn of the game (and the board size is odd)
-                    if self.n % 2 == 1 and self.n_turns == 1 and aX * 2 == y * 2 == self.n - 1:
-                        valid_move = False
-                    else:
-                        valid_move = True
-
-        return (_ACTION_PLACE, x, y)
+        return (_ACTION_PLACE, move[0], move[1])
 
     def turn(self, player, action):
         """
@@ -199,40 +461,78 @@ class Player:
 
             if self.n_turns > (self.n) * 2 - 1:
                 print(self.detect_win(coord, player))
-            self.occ_coords.append((x, y))
 
         elif action[0] == _ACTION_STEAL:
             if self.player != player:
                 self.stolen = True
             self.swap()
 
+        # Actual moves are never undone
+        for structure in self._incremental:
+            structure.clear_trail()
+        self.history.append((player, action))
+
         self.n_turns += 1
 
-    def axial_x(self, x):
-        """
-        Flips the value of the x-coordinate along the middle of the board to
-        get an axial x-coordinate.
-        """
-        x = abs((self.n - 1) - x)
-        return x
+        if self.ponderer is not None:
+            if player == self.original_player:
+                self.ponderer.start(self.history)
+            else:
+                self.ponderer.opponent_moved(player, action)
 
     def set_token(self, coord, token):
         """
         Given a set of coordinates, update the internal representation of the board
         """
-        aX = self.axial_x(coord[0])
-        y = coord[1]
-        self._data[aX][y] = token
+        idx = coord[0] * self.n + coord[1]
+        old_token = self._cells[idx]
+        self._cells[idx] = token
+        if token != old_token:
+            self._key ^= self._zobrist[idx][old_token] ^ self._zobrist[idx][token]
+        for dmap in self._all_dist_maps:
+            dmap.update(idx, token)
+        if token != old_token:
+            if old_token != 0:
+                self.chains[_TOKEN_MAP_OUT[old_token]].remove(idx)
+            if token != 0:
+                self.chains[_TOKEN_MAP_OUT[token]].add(idx)
+
+    def board_array(self):
+        """
+        Returns the board as an (n, n) array of tokens indexed [r, q]
+        """
+        return array(self._cells, dtype=uint8).reshape(self.n, self.n)
+
+    def push_token(self, coord, token):
+        """
+        Place a token for a hypothetical move (applying any captures it
+        makes), which is reverted by the matching call to pop_token
+        """
+        marks = [structure.mark() for structure in self._incremental]
+        changed = [(coord, self.get_token(coord))]
+        key = self._key
+        self.set_token(coord, token)
+        for captured in self.apply_captures(coord):
+            changed.append((captured, _SWAP_PLAYER[token]))
+        self._undo_stack.append((changed, marks, key))
+
+    def pop_token(self):
+        """
+        Revert the most recent hypothetical move made with push_token
+        """
+        changed, marks, self._key = self._undo_stack.pop()
+        for coord, token in changed:
+            self._cells[coord[0] * self.n + coord[1]] = token
+        for structure, mark in zip(self._incremental, marks):
+            structure.undo(mark)
 
     def get_token(self, coord):
-        aX = self.axial_x(coord[0])
-        y = coord[1]
-        return self._data[aX][y]
+        return self._cells[coord[0] * self.n + coord[1]]
 
     def apply_captures(self, coord):
         """
         Check coord for diamond captures, and apply these to the board
-        if they exist
+        if they exist. Returns a list of captured token coordinates
         (taken from the 'referee' module written by the COMP30024 teaching staff).
         """
         opp_type = self.get_token(coord)
@@ -254,6 +554,8 @@ class Player:
         for coord in captured:
             self.set_token(coord, 0)
 
+        return list(captured)
+
     def check_captures(self, coord):
         """
         Check coord for diamond captures and returns a list of captured token coordinates
@@ -303,8 +605,8 @@ class Player:
         Returns (within-bounds) neighbouring coordinates for given coord
         (taken from the 'referee' module written by the COMP30024 teaching staff).
         """
-        return [_ADD(coord, step) for step in _HEX_STEPS \
-                if self.inside_bounds(_ADD(coord, step))]
+        coords = self._coords
+        return [coords[i] for i in self._neighbours[coord[0] * self.n + coord[1]]]
 
     def connected_coords(self, start_coord):
         """
@@ -321,17 +623,16 @@ class Player:
 
         # Use bfs from start coordinate
         reachable = set()
-        queue = Queue(0)
-        queue.put(start_coord)
+        queue = deque([start_coord])
 
-        while not queue.empty():
+        while queue:
 
-            curr_coord = queue.get()
+            curr_coord = queue.popleft()
             reachable.add(curr_coord)
 
             for coord in self._coord_neighbours(curr_coord):
                 if coord not in reachable and self.get_token(coord) == token_type:
-                    queue.put(coord)
+                    queue.append(coord)
 
         reachable = list(reachable)
 
@@ -343,77 +644,31 @@ class Player:
 
         return reachable, endpoints
 
-    def find_player_tokens(self, token):
-        positions = []
-        for x in range(self.n):
-            for y in range(self.n):
-                if self._data[x][y] == token:
-                    aX = self.axial_x(x)
-                    positions.append((aX, y))
-        return positions
-
-    def find_longest_chain(self):
-        all_tokens = self.find_player_tokens(_TOKEN_MAP_IN[self.player])
-        searched = []
-        maxChainLen = 0
-        maxChain = []
-        maxChainEnds = []
-        for coord in all_tokens:
-            if coord not in searched:
-                reachable, endpoints = self.connected_coords(coord)
-                searched += reachable
-                if len(reachable) > maxChainLen:
-                    maxChainLen = len(reachable)
-                    maxChain = reachable.copy()
-                    maxChainEnds = endpoints.copy()
-
-        return maxChain, maxChainEnds
+    def find_longest_chain(self, player=None):
+        """
+        Returns the coordinates and endpoints of the longest chain of the
+        given player (the current player by default)
+        """
+        chains = self.chains[player or self.player]
+        cid = chains.longest()
+        if cid == 0:
+            return [], []
+        return chains.chain_coords(cid), chains.endpoints(cid)
 
     def find_opp_longest_chain(self):
         if self.player == RED:
             opp = BLUE
         else:
             opp = RED
-        all_tokens = self.find_player_tokens(_TOKEN_MAP_IN[opp])
-        searched = []
-        maxChainLen = 0
-        maxChain = []
-        maxChainEnds = []
-        for coord in all_tokens:
-            if coord not in searched:
-                reachable, endpoints = self.connected_coords(coord)
-                searched += reachable
-                if len(reachable) > maxChainLen:
-                    maxChainLen = len(reachable)
-                    maxChain = reachable.copy()
-                    maxChainEnds = endpoints.copy()
-
-        return maxChain, maxChainEnds
-
-    def enum_coords(self, n):
-        all_coords = []
-        for i in range(0, n):
-            for j in range(0, n):
-                new_coord = (i, j)
-                all_coords.append(new_coord)
-        return all_coords
-
-    def compute_path(self, n, start_coord, goal_coord, occ_coords, f_h=lambda *_: 0):
+        return self.find_longest_chain(opp)
+
+    def compute_path(self, start_coord, goal_coord):
         """
         Compute lowest cost path on Cachex board. Internally uses A*
         (taken from the subject modules written by the COMP30024 teaching staff).
         """
-
-        # Using a set will be a lot more efficient than a list here
-        occ_coords = set(occ_coords)
-
-        # Returns true iff coord is valid (inside board bounds, not occupied)
-        def valid_coord(coord):
-            (r, q) = coord
-            return 0 <= r < n and 0 <= q < n and (not coord in occ_coords)
-
         # Run A* and return path (default empty list if no path)
-        return self.a_star(start_coord, goal_coord, f_h, self._coord_neighbours) or []
+        return self.a_star(start_coord, goal_coord) or []
 
     def axial_distance(self, coord, goal_coord):
         """
@@ -426,143 +681,236 @@ class Player:
             + abs(a_q + a_r - b_q - b_r)
             + abs(a_r - b_r)) / 2
 
-    def backtrace_path(self, goal_node, start_node, came_from):
+    def backtrace_path(self, goal, start, parent):
         """
-        Compute minimal cost path from the goal node to the start node given 
-        a dictionary of "came from" node mappings
-        (taken from the subject modules written by the COMP30024 teaching staff).
+        Compute minimal cost path from the goal cell to the start cell given
+        an array of parent flat indices, returning it as a list of coordinates
+        (adapted from the subject modules written by the COMP30024 teaching staff).
         """
+        coords = self._coords
         path = []
-        curr_node = goal_node
-        while curr_node != start_node:
-            path.append(curr_node)
-            curr_node = came_from[curr_node]
-        path.append(start_node)
+        curr = goal
+        while curr != start:
+            path.append(coords[curr])
+            curr = parent[curr]
+        path.append(coords[start])
         path.reverse()
         return path
 
-    def a_star(self, start_node, goal_node, f_h, f_n, f_w=lambda *_: 1):
+    def a_star(self, start_node, goal_node):
         """
-        Perform an A* search given start and end node objects, and functions
-        to compute problem-domain-specific values
-        (taken from the subject modules written by the COMP30024 teaching staff).
+        Perform an A* search between two coordinates using the axial distance
+        heuristic, where the current player's tokens and empty cells can be
+        traversed at unit cost
+        (adapted from the subject modules written by the COMP30024 teaching staff).
+
+        Cells are handled as flat indices with a precomputed neighbour table,
+        and the cost/parent arrays are reused between calls by stamping their
+        entries with a per-search generation number.
         """
-        open_nodes = PriorityQueue()
-        open_nodes.put((0, 0, start_node))
-        closed_nodes = set()
-        came_from = {}
-        g = { start_node: 0 }
-
-        while not open_nodes.empty():
+        n = self.n
+        start = start_node[0] * n + start_node[1]
+        goal = goal_node[0] * n + goal_node[1]
+        h = heuristic_table(n, goal_node)
+
+        cells = self._cells
+        neighbours = self._neighbours
+        g = self._g
+        parent = self._parent
+        open_gen = self._open_gen
+        closed_gen = self._closed_gen
+        self._search_gen += 1
+        gen = self._search_gen
+
+        # Tokens of the other player are the only cells that cannot be crossed
+        blocked = _SWAP_PLAYER[_TOKEN_MAP_IN[self.player]]
+
+        g[start] = 0
+        open_gen[start] = gen
+        open_nodes = [(0, 0, start)]
+        self.astar_calls += 1
+
+        while open_nodes:
             # Get lowest f(x) cost node, or lowest h(x) in case of ties
-            *_, curr_node = open_nodes.get()
-            closed_nodes.add(curr_node)
+            *_, curr = heappop(open_nodes)
+            if closed_gen[curr] == gen:
+                continue
+            closed_gen[curr] = gen
+            self.astar_expansions += 1
 
             # Check if we reached goal
-            if curr_node == goal_node:
-                return self.backtrace_path(goal_node, start_node, came_from)
+            if curr == goal:
+                return self.backtrace_path(goal, start, parent)
 
             # Expand and add neighbours to queue
-            for neighbour_node in f_n(curr_node):
-                
-                if self.get_token(neighbour_node) == _TOKEN_MAP_IN[self.player] or self.get_token(neighbour_node) == 0:
-                    # Compute neighbour g(x) and ensure it is not in closed set
-                    neighbour_g = g[curr_node] + f_w(curr_node, neighbour_node)
-                    is_lowest_cost_so_far = neighbour_g < g.get(neighbour_node, inf)
-                    closed_node = neighbour_node in closed_nodes
-
-                    if not closed_node and is_lowest_cost_so_far:
-                        # Update g/parent values for this neighbour node
-                        g[neighbour_node] = neighbour_g
-                        came_from[neighbour_node] = curr_node
-
-                        # Add to queue with priority by f(x), then h(x) (for ties)
-                        neighbour_h = f_h(neighbour_node, goal_node)
-                        neighbour_f = neighbour_g + neighbour_h
-                        open_nodes.put((neighbour_f, neighbour_h, neighbour_node))
+            neighbour_g = g[curr] + 1
+            for neighbour in neighbours[curr]:
+                if cells[neighbour] == blocked or closed_gen[neighbour] == gen:
+                    continue
+                if open_gen[neighbour] != gen or neighbour_g < g[neighbour]:
+                    # Update g/parent values for this neighbour node
+                    g[neighbour] = neighbour_g
+                    open_gen[neighbour] = gen
+                    parent[neighbour] = curr
+
+                    # Add to queue with priority by f(x), then h(x) (for ties)
+                    neighbour_h = h[neighbour]
+                    heappush(open_nodes, (neighbour_g + neighbour_h, neighbour_h, neighbour))
 
         # No path found if we reach this point
         return None
 
 
 
-    def get_possible_moves(self):
+    def hop_distances(self, start_coord):
+        """
+        Number of steps from start_coord to every cell through cells the
+        current player can pass through (INF for cells that cannot be reached)
+        """
+        n = self.n
+        cells = self._cells
+        neighbours = self._neighbours
+        blocked = _SWAP_PLAYER[_TOKEN_MAP_IN[self.player]]
+
+        start = start_coord[0] * n + start_coord[1]
+        distances = [INF] * (n * n)
+        distances[start] = 0
+        frontier = [start]
+        i = 0
+        while i < len(frontier):
+            curr = frontier[i]
+            dist = distances[curr] + 1
+            for neighbour in neighbours[curr]:
+                if distances[neighbour] == INF and cells[neighbour] != blocked:
+                    distances[neighbour] = dist
+                    frontier.append(neighbour)
+            i += 1
+        return distances
+
+    def border_target(self, distances, sides):
+        """
+        Returns the closest reachable cell on the given sides of the current
+        player's borders (the first in board order in case of ties), or
+        (-1, -1) if there is none
+        """
+        axis = _PLAYER_AXIS[self.player]
+        target = (-1, -1)
+        nearest = INF
+        coords = self._coords
+        for idx in self._border_cells[self.player]:
+            if coords[idx][axis] in sides and distances[idx] < nearest:
+                nearest = distances[idx]
+                target = coords[idx]
+        return target
+
+    def eval_context(self):
+        """
+        Gather the facts about the current position (with the current player
+        to move) that move generation and the evaluation of every child
+        position share
+        """
+        if self.player == RED:
+            opp = BLUE
+        else:
+            opp = RED
+        oppChain, endpointsOpp = self.find_longest_chain(opp)
+        threats = ThreatMaps(self.board_array())
+        chain_mask = zeros((self.n, self.n), dtype=bool)
+        if oppChain:
+            chain_mask[tuple(zip(*oppChain))] = True
+
+        # Ignore the opponent endpoints if already at the border
+        axis = _PLAYER_AXIS[self.player]
+        endpointsOpp = [endpoint for endpoint in endpointsOpp if endpoint[axis] not in (0, self.n - 1)]
 
+        # Break a sufficiently long chain of the opponent: empty cells next
+        # to its ends that touch a single token of the chain, in pairs two
+        # cells apart
+        block_moves = []
+        if len(oppChain) > float(self.n) / 2:
+            end_mask = zeros((self.n, self.n), dtype=bool)
+            if endpointsOpp:
+                end_mask[tuple(zip(*endpointsOpp))] = True
+            pos_block = threats.empty & (threats.neighbour_count(end_mask) > 0) & \
+                (threats.neighbour_count(chain_mask) == 1)
+            block = pos_block & threats.at_distance_two(pos_block)
+            block_moves = [self._coords[idx] for idx in flatnonzero(block)]
+
+        # Cells on the opponent's shortest paths from its chain ends to its
+        # borders (with the carriers of the virtual connections they take): a
+        # token anywhere else leaves its connection distance as is
+        opp_distance = self.connection_distance(opp)
+        opp_path_cells = None
+        opp_chains = self.chains[opp]
+        cid = opp_chains.longest()
+        if cid != 0:
+            opp_path_cells = set()
+            for dist_map, end in zip(self.dist_maps[opp], opp_chains.ends(cid)):
+                opp_path_cells.update(dist_map.path_cells(end))
+
+        # Captures for the player, splits of the bridges the opponent's
+        # longest chain is part of, and replies to intrusions into the
+        # player's bridges
+        capture_cells = set(flatnonzero(threats.captures(_TOKEN_MAP_IN[self.player])).tolist())
+        threat_cells = set(flatnonzero(threats.captures(_TOKEN_MAP_IN[opp])).tolist())
+        bridges = threats.bridge_intrusions(_TOKEN_MAP_IN[opp]) & (threats.neighbour_count(chain_mask) > 0)
+        bridge_cells = set(flatnonzero(bridges).tolist())
+        repair_cells = set(flatnonzero(threats.bridge_repairs(_TOKEN_MAP_IN[self.player])).tolist())
+
+        return EvalContext(opp, oppChain, block_moves, opp_distance, opp_path_cells,
+                           capture_cells, threat_cells, bridge_cells, repair_cells, self.connections())
+
+    def connections(self):
+        """
+        Returns the low and high border distances of each player, with the
+        length of its shortest connection (as their sum over any cell)
+        """
+        connections = []
+        for low_map, high_map in self.dist_maps.values():
+            low, high = low_map.dist, high_map.dist
+            connections.append((low, high, min(map(int.__add__, low, high))))
+        return connections
 
+    def cell_slack(self, idx, context):
+        """
+        How much longer the shortest connection of either player through
+        the cell idx is than that player's shortest connection. Dead cells,
+        that no connection can pass through, are INF or more away
+        """
+        return min(low[idx] + high[idx] - shortest for low, high, shortest in context.connections)
+
+    def is_capture_move(self, coord, context):
+        """
+        True iff placing a token on coord would capture opponent tokens
+        """
+        return coord[0] * self.n + coord[1] in context.capture_cells
+
+    def path_moves(self):
+        """
+        Returns the first empty cells on the current player's shortest paths
+        from the ends of its longest chain to its borders
+        """
         maxChain, endpoints = self.find_longest_chain()
-        
-        # Find out which borders the endpoints are closest to
-        borders = self.border_coords[self.player]
+
+        # Find the closest borders to the endpoints: the lower end heads for
+        # the low border and the higher end for the high one, while a chain
+        # lying along a single row heads for whichever it does not touch yet
+        axis = _PLAYER_AXIS[self.player]
         border_targets = []
         if len(endpoints) == 2:
-            if (endpoints[0][_PLAYER_AXIS[self.player]] <= endpoints[1][_PLAYER_AXIS[self.player]]):
-                closest_border1 = (-1, -1)
-                nearest_dist1 = 999
-                closest_border2 = (-1, -1)
-                nearest_dist2 = 999
-                for border in borders:
-                    if border[_PLAYER_AXIS[self.player]] == 0:
-                        if self.get_token(border) == _TOKEN_MAP_IN[self.player] or self.get_token(border) == 0:
-                            path1 = self.compute_path(self.n, endpoints[0], border, self.occ_coords, self.axial_distance)
-                            dist1 = len(path1)
-                            if dist1 >= 1 and dist1 < nearest_dist1:
-                                nearest_dist1 = dist1
-                                closest_border1 = border
-                    else:
-                        if self.get_token(border) == _TOKEN_MAP_IN[self.player] or self.get_token(border) == 0:
-                            path2 = self.compute_path(self.n, endpoints[1], border, self.occ_coords, self.axial_distance)
-                            dist2 = len(path2)
-                            if dist2 >= 1 and dist2 < nearest_dist2:
-                                nearest_dist2 = dist2
-                                closest_border2 = border
-                border_targets.append(closest_border1)
-                border_targets.append(closest_border2)
-            else:
-                closest_border1 = (-1, -1)
-                nearest_dist1 = 999
-                closest_border2 = (-1, -1)
-                nearest_dist2 = 999
-                for border in borders:
-                    if border[_PLAYER_AXIS[self.player]] == self.n-1:
-                        if self.get_token(border) == _TOKEN_MAP_IN[self.player] or self.get_token(border) == 0:
-                            path1 = self.compute_path(self.n, endpoints[0], border, self.occ_coords, self.axial_distance)
-                            dist1 = len(path1)
-                            if dist1 >= 1 and dist1 < nearest_dist1:
-                                nearest_dist1 = dist1
-                                closest_border1 = border
-                    else:
-                        if self.get_token(border) == _TOKEN_MAP_IN[self.player] or self.get_token(border) == 0:
-                            path2 = self.compute_path(self.n, endpoints[1], border, self.occ_coords, self.axial_distance)
-                            dist2 = len(path2)
-                            if dist2 >= 1 and dist2 < nearest_dist2:
-                                nearest_dist2 = dist2
-                                closest_border2 = border
-                border_targets.append(closest_border1)
-                border_targets.append(closest_border2)
+            for endpoint, side in zip(sorted(endpoints, key=lambda end: end[axis]), (0, self.n - 1)):
+                border_targets.append(self.border_target(self.hop_distances(endpoint), (side,)))
+            if endpoints[0][axis] > endpoints[1][axis]:
+                border_targets.reverse()
         elif len(endpoints) == 1:
-            closest_border = (-1, -1)
-            nearest_dist = 999
-            for border in borders:
-                skip = False
-                for coord in maxChain:
-                    if (coord[_PLAYER_AXIS[self.player]] == border[_PLAYER_AXIS[self.player]] == self.n - 1) or (coord[_PLAYER_AXIS[self.player]] == border[_PLAYER_AXIS[self.player]] == 0):
-                        skip = True
-                        break
-                if (skip == False):
-                    if self.get_token(border) == _TOKEN_MAP_IN[self.player] or self.get_token(border) == 0:
-                        path = self.compute_path(self.n, endpoints[0], border, self.occ_coords, self.axial_distance)
-                        dist = len(path)
-                        if dist >=1 and dist < nearest_dist:
-                            nearest_dist = dist
-                            closest_border = border
-            border_targets.append(closest_border)
-            
+            sides = tuple(side for side in (0, self.n - 1) if endpoints[0][axis] != side)
+            border_targets.append(self.border_target(self.hop_distances(endpoints[0]), sides))
+
         # Find the shortest path from ends to the borders
         paths = []
         for i in range(len(endpoints)):
-            path = self.compute_path(self.n, endpoints[i], border_targets[i], self.occ_coords, self.axial_distance)
+            path = self.compute_path(endpoints[i], border_targets[i])
             paths.append(path)
-        #print(paths)
 
         moves = []
         for path in paths:
@@ -572,201 +920,272 @@ class Player:
                         moves.append(coord)
                         break
 
-        # Find out if the opponent can be attacked
-        if self.player == RED:
-            opp = BLUE
-        else:
-            opp = RED
-        oppChain, endpointsOpp = self.find_opp_longest_chain()
+        # Also take the first empty cell on the shortest paths that use
+        # virtual connections (which may be a bridge away from the chain)
+        chains = self.chains[self.player]
+        cid = chains.longest()
+        if cid != 0:
+            for dist_map, end in zip(self.dist_maps[self.player], chains.ends(cid)):
+                while end != -1 and self._cells[end] != 0:
+                    end = dist_map.parent[end]
+                if end != -1:
+                    moves.append(self._coords[end])
+        return moves
 
-        # Ignore the opponent endpoints if already at the border
-        remove = []
-        for endpoint in endpointsOpp:
-            if endpoint in self.border_coords[self.player]:
-                remove.append(endpoint)
-        for endpoint in remove:
-            endpointsOpp.remove(endpoint)
+    def passes_filter(self, idx, slack, context):
+        """
+        True iff a candidate move on the cell idx, with the given slack (see
+        cell_slack), is kept: it lies on a near-shortest connection, or it
+        captures or saves a bridge (which change the board)
+        """
+        return slack <= _PATH_SLACK or idx in context.capture_cells or idx in context.repair_cells
+
+    def get_possible_moves(self, context=None):
+        if context is None:
+            context = self.eval_context()
+
+        moves = self.path_moves()
 
         # Break a sufficiently long chain of the opponent
-        pos_block_moves = []
-        if len(oppChain) > float(self.n) / 2:
-            for endpoint in endpointsOpp:
-                for neighbour in self._coord_neighbours(endpoint):
-                    
-                    if self.get_token(neighbour) == 0:
-                       
-                        opp_around = 0
-                        for neighbour2 in self._coord_neighbours(neighbour):
-                            if self.get_token(neighbour2) == _TOKEN_MAP_IN[opp] and neighbour2 in oppChain:
-                                opp_around += 1
-                        if opp_around == 1:
-                            
-                            pos_block_moves.append(neighbour)
-
-            for move in pos_block_moves:
-                for move2 in pos_block_moves:
-                    
-                    dist = self.axial_distance(move, move2)
-                    if dist == 2:
-                        moves.append(move)
+        moves += context.block_moves
 
         # Check if a capture can be made
-        for coord in self.occ_coords:
-            if self.get_token(coord) == _TOKEN_MAP_IN[opp]:
-                for neighbour in self._coord_neighbours(coord): 
-                    if self.get_token(neighbour) == 0:
-                        captured = self.check_captures(neighbour)
-                        if len(captured) != 0:
-                            moves.append(neighbour)
-                            
+        moves += [self._coords[idx] for idx in sorted(context.capture_cells)]
 
-        moves = list(set(moves))
+        # Split the bridges of the opponent's longest chain
+        moves += [self._coords[idx] for idx in sorted(context.bridge_cells)]
 
+        # Save the player's bridges the opponent has intruded into
+        moves += [self._coords[idx] for idx in sorted(context.repair_cells)]
 
-        return moves
+        # Drop dead cells and cells off every near-shortest connection (but
+        # never captures or bridge repairs, which change the board), then try
+        # the moves closest to a shortest connection first
+        n = self.n
+        slack = {move: self.cell_slack(move[0] * n + move[1], context) for move in set(moves)}
+        moves = [move for move in slack
+                 if self.passes_filter(move[0] * n + move[1], slack[move], context)] or list(slack)
+        moves.sort(key=lambda move: (slack[move], move))
 
-    def eval(self, coord):
-        value = 0
-        self.set_token(coord, _TOKEN_MAP_IN[self.player])
-
-        maxChain, endpoints = self.find_longest_chain()
-        
-        borders = self.border_coords[self.player]
-        border_targets = []
+        return moves
 
-        if len(endpoints) == 2:
-            if (endpoints[0][_PLAYER_AXIS[self.player]] <= endpoints[1][_PLAYER_AXIS[self.player]]):
-                closest_border1 = (-1, -1)
-                nearest_dist1 = 999
-                closest_border2 = (-1, -1)
-                nearest_dist2 = 999
-                for border in borders:
-                    if border[_PLAYER_AXIS[self.player]] == 0:
-                        if self.get_token(border) == _TOKEN_MAP_IN[self.player] or self.get_token(border) == 0:
-                            path1 = self.compute_path(self.n, endpoints[0], border, self.occ_coords, self.axial_distance)
-                            dist1 = len(path1)
-                            if dist1 < nearest_dist1:
-                                nearest_dist1 = dist1
-                                closest_border1 = border
-                    else:
-                        if self.get_token(border) == _TOKEN_MAP_IN[self.player] or self.get_token(border) == 0:
-                            path2 = self.compute_path(self.n, endpoints[1], border, self.occ_coords, self.axial_distance)
-                            dist2 = len(path2)
-                            if dist2 < nearest_dist2:
-                                nearest_dist2 = dist2
-                                closest_border2 = border
-                border_targets.append(closest_border1)
-                border_targets.append(closest_border2)
-            else:
-                closest_border1 = (-1, -1)
-                nearest_dist1 = 999
-                closest_border2 = (-1, -1)
-                nearest_dist2 = 999
-                for border in borders:
-                    if border[_PLAYER_AXIS[self.player]] == self.n-1:
-                        if self.get_token(border) == _TOKEN_MAP_IN[self.player] or self.get_token(border) == 0:
-                            path1 = self.compute_path(self.n, endpoints[0], border, self.occ_coords, self.axial_distance)
-                            dist1 = len(path1)
-                            if dist1 < nearest_dist1:
-                                nearest_dist1 = dist1
-                                closest_border1 = border
-                    else:
-                        if self.get_token(border) == _TOKEN_MAP_IN[self.player] or self.get_token(border) == 0:
-                            path2 = self.compute_path(self.n, endpoints[1], border, self.occ_coords, self.axial_distance)
-                            dist2 = len(path2)
-                            if dist2 < nearest_dist2:
-                                nearest_dist2 = dist2
-                                closest_border2 = border
-                border_targets.append(closest_border1)
-                border_targets.append(closest_border2)
-        elif len(endpoints) == 1:
-            closest_border = (-1, -1)
-            nearest_dist = 999
-            for border in borders:
-                skip = False
-                for coord in maxChain:
-                    if (coord[_PLAYER_AXIS[self.player]] == border[_PLAYER_AXIS[self.player]] == self.n - 1) or (coord[_PLAYER_AXIS[self.player]] == border[_PLAYER_AXIS[self.player]] == 0):
-                        skip = True
-                        break
-                if (skip == False):
-                    if self.get_token(border) == _TOKEN_MAP_IN[self.player] or self.get_token(border) == 0:
-                        path = self.compute_path(self.n, endpoints[0], border, self.occ_coords, self.axial_distance)
-                        dist = len(path)
-                        if dist < nearest_dist:
-                            nearest_dist = dist
-                            closest_border = border
-            border_targets.append(closest_border)
-            
-            
-            
-        # Find the shortest path from ends to the borders
-        paths = []
-        for i in range(len(endpoints)):
-            path = self.compute_path(self.n, endpoints[i], border_targets[i], self.occ_coords, self.axial_distance)
-            paths.append(path)
+    def pick_moves(self, context, depth):
+        """
+        Yields the candidate moves of the current position (as kept by
+        get_possible_moves), with depth plies left, in stages: killer moves,
+        captures, and then the rest, which need the player's shortest paths
+        (the most work to find). A stage is only generated once every move
+        before it has been searched without a cutoff. Each move comes with
+        its score if it is a quiet leaf move (None otherwise), scored a stage
+        at a time
+        """
+        n = self.n
+        cells = self._cells
+        coords = self._coords
+        history = self.cutoff_history
+        stages = (
+            lambda: [move for move in self.killers[depth] if move in context_moves] if self.ordering else [],
+            lambda: [coords[idx] for idx in context.capture_cells],
+            lambda: self.path_moves() + context.block_moves +
+            [coords[idx] for idx in context.bridge_cells | context.repair_cells])
+
+        # Killer moves are only tried first when they are candidates found
+        # without path finding (and otherwise take their turn)
+        context_moves = set(context.block_moves)
+        context_moves.update(coords[idx] for idx in context.capture_cells | context.bridge_cells |
+                             context.repair_cells)
+
+        seen = set()
+        dropped = {}
+        found = False
+        for i, stage in enumerate(stages):
+            moves = {}
+            for move in stage():
+                idx = move[0] * n + move[1]
+                if move in seen or cells[idx] != 0:
+                    continue
+                slack = self.cell_slack(idx, context)
+                if self.passes_filter(idx, slack, context):
+                    moves[move] = slack
+                else:
+                    dropped[move] = slack
+                seen.add(move)
+            if moves:
+                found = True
+                if i > 0:
+                    moves = sorted(moves, key=lambda move: (
+                        -history[move[0] * n + move[1]] if self.ordering else 0, moves[move], move))
+                yield from self.leaf_scored(list(moves), context, depth)
+
+        # Search everything if every candidate was dropped
+        if not found:
+            yield from self.leaf_scored(sorted(dropped, key=lambda move: (dropped[move], move)),
+                                        context, depth)
+
+    def leaf_scored(self, moves, context, depth):
+        """
+        Yields each move with its score if it is a quiet leaf move (one with
+        a single ply left that is evaluated without searching it), and None
+        otherwise
+        """
+        scores = {}
+        if depth == 1:
+            quiet = [move for move in moves if not self.is_noisy(move, context)]
+            if quiet:
+                scores = dict(zip(quiet, self.score_moves(quiet, context)))
+        for move in moves:
+            yield move, scores.get(move)
+
+    def connects(self, player, low, high):
+        """
+        True iff a chain of the given player with ends low and high (flat
+        indices) actually touches both of its borders, winning the game
+        """
+        low_map, high_map = self.dist_maps[player]
+        return low_map.is_source[low] and high_map.is_source[high]
 
-        adjust = 0
-        for path in paths:
-            if path != []:
-                adjust += 1
-            value += len(path)
-        value -= adjust # Taking into account that a chain can have two different endpoints
+    def chain_distance(self, player, low, high):
+        """
+        Number of cells a chain of the given player with ends low and high
+        (flat indices) still has to cross to reach both of its borders,
+        counting virtual connections as made (0 once it actually connects
+        them, _UNREACHABLE if it is cut off from either). A chain that only
+        virtually reaches both borders is still 1 away, so 0 always means
+        the game is over
+        """
+        low_map, high_map = self.dist_maps[player]
+        low_dist = low_map.dist[low]
+        high_dist = high_map.dist[high]
+        if low_dist >= INF or high_dist >= INF:
+            return _UNREACHABLE
+        distance = low_dist + high_dist - 2
+        if distance == 0 and not (low_map.is_source[low] and high_map.is_source[high]):
+            return 1
+        return distance
+
+    def connection_distance(self, player):
+        """
+        Connection distance (see chain_distance) of the player's longest chain
+        """
+        chains = self.chains[player]
+        cid = chains.longest()
+        if cid != 0:
+            return self.chain_distance(player, *chains.ends(cid))
 
-        self.set_token(coord, 0)
+        # No tokens yet: the shortest border to border path through any cell
+        low_map, high_map = self.dist_maps[player]
+        shortest = min(map(int.__add__, low_map.dist, high_map.dist)) - 1
+        return shortest if shortest < INF else _UNREACHABLE
 
-        # Find out if the opponent can be attacked
-        block_moves = []
-        if self.player == RED:
-            opp = BLUE
+    def score(self, player_distance, opp_distance, player=None):
+        """
+        Score a position from the connection distances of the given player
+        (the one the search is for by default) and its opponent, from the
+        point of view of the player the search is for
+        """
+        if player is not None and player != self.original_player:
+            player_distance, opp_distance = opp_distance, player_distance
+        if player_distance == 0:
+            return _WIN_SCORE
+        if opp_distance == 0:
+            return -_WIN_SCORE
+        return opp_distance - player_distance
+
+    def eval(self):
+        """
+        Score the current position for the player the search is for (higher
+        is better): how much closer its longest chain is to connecting its
+        borders than the opponent's is
+        """
+        self.evals += 1
+        cache = self.eval_cache
+        if cache is None:
+            return self.score(self.connection_distance(self.original_player),
+                              self.connection_distance(_OPPONENT[self.original_player]))
+
+        value = cache.get(self._key)
+        if value is None:
+            value = self.score(self.connection_distance(self.original_player),
+                               self.connection_distance(_OPPONENT[self.original_player]))
+            cache.put(self._key, value)
+        return value
+
+    def eval_move(self, coord, context):
+        """
+        Score (as eval) the position reached by the current player placing a
+        token on the empty cell coord, reusing the context of the current
+        position. Only moves that capture, or that cut one of the opponent's
+        shortest paths, have to be played out on the board
+        """
+        idx = coord[0] * self.n + coord[1]
+        opp_path_cells = context.opp_path_cells
+        if opp_path_cells is None or idx in opp_path_cells or self.is_capture_move(coord, context):
+            self.push_token(coord, _TOKEN_MAP_IN[self.player])
+            value = self.eval()
+            self.pop_token()
+            return value
+
+        # The player's own border distances do not depend on where its own
+        # tokens are, so only its longest chain has to be updated for coord
+        self.evals += 1
+        low, high = self.chains[self.player].ends_after_add(idx)
+        return self.score(self.chain_distance(self.player, low, high), context.opp_distance, self.player)
+
+    def score_moves(self, moves, context):
+        """
+        Score (as eval_move) the positions reached by the current player
+        placing a token on each of the empty cells in moves, returning the
+        scores in the same order. The moves that leave the opponent's
+        distances as they are, which is most of them, are scored together
+        with array operations on the distance fields of the position
+        """
+        n = self.n
+        scores = [None] * len(moves)
+        quiet = []
+        opp_path_cells = context.opp_path_cells
+        for i, coord in enumerate(moves):
+            idx = coord[0] * n + coord[1]
+            if opp_path_cells is None or idx in opp_path_cells or self.is_capture_move(coord, context):
+                scores[i] = self.eval_move(coord, context)
+            else:
+                quiet.append(i)
+        if not quiet:
+            return scores
+        self.evals += len(quiet)
+
+        # Connection distance of the player's longest chain after each move
+        low_map, high_map = self.dist_maps[self.player]
+        lows, highs = self.chains[self.player].ends_after_adds(
+            [moves[i][0] * n + moves[i][1] for i in quiet])
+        low_dist = array(low_map.dist)[lows]
+        high_dist = array(high_map.dist)[highs]
+        distance = where((low_dist >= INF) | (high_dist >= INF), _UNREACHABLE, low_dist + high_dist - 2)
+
+        # Only virtually connected chains are still 1 away (see chain_distance)
+        virtual = (distance == 0) & ~(array(low_map.is_source)[lows] & array(high_map.is_source)[highs])
+        distance = where(virtual, 1, distance)
+
+        # As score, for the player the search is for
+        if self.player == self.original_player:
+            own, other = distance, context.opp_distance
         else:
-            opp = RED
-        oppChain, endpointsOpp = self.find_opp_longest_chain()
-
-        # Ignore the opponent endpoints if already at the border
-        remove = []
-        for endpoint in endpointsOpp:
-            if endpoint in self.border_coords[self.player]:
-                remove.append(endpoint)
-        for endpoint in remove:
-            endpointsOpp.remove(endpoint)
-
-        # Block a sufficiently long chain of the opponent
-        pos_block_moves = []
-        if len(oppChain) > float(self.n) / 2:
-            for endpoint in endpointsOpp:
-                for neighbour in self._coord_neighbours(endpoint):
-                    
-                    if self.get_token(neighbour) == 0:
-                       
-                        opp_around = 0
-                        for neighbour2 in self._coord_neighbours(neighbour):
-                            if self.get_token(neighbour2) == _TOKEN_MAP_IN[opp] and neighbour2 in oppChain:
-                                opp_around += 1
-                        if opp_around == 1:
-                            
-                            pos_block_moves.append(neighbour)
-
-            for move in pos_block_moves:
-                for move2 in pos_block_moves:
-                    
-                    dist = self.axial_distance(move, move2)
-                    if dist == 2:
-                        block_moves.append(move)
-                        
-            block_moves = list(set(block_moves))
-            
-        if coord in block_moves:
-            value = 999
-                
-
-        # Check if a capture can be made
-        captured = self.check_captures(coord)
-        if len(captured) != 0:
-            value = 9999
-            
-                            
+            own, other = context.opp_distance, distance
+        values = where(own == 0, _WIN_SCORE, where(other == 0, -_WIN_SCORE, other - own))
+        for i, value in zip(quiet, values.tolist()):
+            scores[i] = value
+        return scores
 
-        return value        
+    def worker_time(self):
+        """
+        Returns the CPU time used so far by this player's worker processes,
+        which the referee's timer does not see
+        """
+        total = 0.0
+        if self.pool is not None:
+            total += self.pool.cpu_time
+        if self.ponderer is not None:
+            total += self.ponderer.cpu_time
+        return total
 
     def swap(self):
         """
@@ -776,47 +1195,254 @@ class Player:
         (y, x) = self.opening_move
         self.set_token(self.opening_move, 0)
         self.set_token((x,y), 2)
-        self.occ_coords.remove((y,x))
-        self.occ_coords.append((x,y))
 
     def make_best_move(self):
+        """
+        Search every candidate move for the current position, returning the
+        best score and move (None if there are no candidates)
+        """
+        self.check_abort()
+        self.player = self.original_player
+        self.cutoff_history = [score >> 1 for score in self.cutoff_history]
+        self.searches += 1
+        self.depth_times = []
+        self.pv = []
+        context = self.eval_context()
+        moves = self.get_possible_moves(context)
+        self.check_abort()
+
+        # Try the moves with the best static scores first (behind the killer
+        # moves and the moves with the most cutoff history)
+        scores = self.score_moves(moves, context)
+        order = sorted(range(len(moves)), key=lambda i: -scores[i])
+        moves = self.order_moves([moves[i] for i in order], _SEARCH_DEPTH)
+        if self.pool is not None and len(moves) > 1:
+            bestScore, tied = self.pool.best_moves(self.history, moves, _SEARCH_DEPTH)
+            return bestScore, self.break_tie(tied)
+        start = time.process_time()
+        bestScore, tied = self.search_root(moves, _SEARCH_DEPTH)
+        self.depth_times.append((_SEARCH_DEPTH, time.process_time() - start))
+        move = self.break_tie(tied)
+        if move is not None:
+            self.pv = self.pv_by_move[move]
+        return bestScore, move
+
+    def search_root(self, moves, depth):
+        """
+        Search every move in moves to depth plies in total, returning the
+        best score and the moves that reach it, in search order (with the
+        principal variation after each in pv_by_move). Without playouts to
+        choose between them, only the first such move is returned
+        """
         bestScore = -inf
-        bestMove = None
-        for move in self.get_possible_moves():
-            score = self.minimax(move, 4, -inf, +inf, True)
-            if (score > bestScore):
+        tied = []
+        self.pv_by_move = {}
+        for move in moves:
+            # Search one below the best score so far when ties are broken, so
+            # that a move tying with it still gets an exact score
+            score = self.search_root_move(move, bestScore - 1 if self.playouts else bestScore, depth)
+            if score > bestScore:
                 bestScore = score
-                bestMove = move
-        return bestScore, bestMove
+                tied = []
+            if score == bestScore and (self.playouts or not tied):
+                tied.append(move)
+                self.pv_by_move[move] = [move] + self.pv_lines[depth - 1]
+        return bestScore, tied
+
+    def break_tie(self, moves):
+        """
+        Returns the move of moves (root moves the search scores the same)
+        after which random playouts win most often for the player, the
+        first on equal win rates (None if there are no moves)
+        """
+        if len(moves) < 2 or not self.playouts:
+            return moves[0] if moves else None
+        if self.rollout is None:
+            self.rollout = BatchRollout(self.n, self.playouts, seed=0)
+        token = _TOKEN_MAP_IN[self.original_player]
+        bestMove, bestWins = None, -1
+        for move in moves:
+            self.push_token(move, token)
+            winners = self.rollout.run(self._cells, _SWAP_PLAYER[token], _MAX_TURNS - self.n_turns)
+            self.pop_token()
+
+            # Drawn playouts count as half a win
+            wins = 2 * int((winners == token).sum()) + int((winners == 0).sum())
+            if wins > bestWins:
+                bestMove, bestWins = move, wins
+        return bestMove
+
+    def search_root_move(self, move, alpha=-inf, depth=_SEARCH_DEPTH):
+        """
+        Score the current player playing move, searching depth plies in total.
+        Scores at or below alpha only bound the move's actual score
+        """
+        self.player = self.original_player
+        self.push_token(move, _TOKEN_MAP_IN[self.player])
+        score = self.minimax(move, depth - 1, alpha, +inf, False)
+        self.pop_token()
+        self.player = self.original_player
+        return score
+
+    def order_moves(self, moves, depth):
+        """
+        Sort moves (in place, keeping their order otherwise) so that the
+        killer moves for the number of plies left come first, followed by
+        the moves with the highest cutoff history
+        """
+        if self.ordering:
+            n = self.n
+            history = self.cutoff_history
+            rank = {move: i for i, move in enumerate(self.killers[depth])}
+            moves.sort(key=lambda move: (rank.get(move, 2), -history[move[0] * n + move[1]]))
+        return moves
+
+    def record_cutoff(self, move, depth, index):
+        """
+        Note that move, searched index-th with depth plies left, caused a
+        cutoff
+        """
+        self.cutoffs += 1
+        if index == 0:
+            self.first_move_cutoffs += 1
+        indices = self.cutoff_indices
+        if index >= len(indices):
+            indices.extend([0] * (index + 1 - len(indices)))
+        indices[index] += 1
+        if self.ordering:
+            killers = self.killers[depth]
+            if move not in killers:
+                killers.insert(0, move)
+                del killers[2:]
+            self.cutoff_history[move[0] * self.n + move[1]] += depth * depth
+
+    def is_noisy(self, coord, context):
+        """
+        True iff the position reached by the current player placing a token
+        on coord is in the middle of a capture exchange: the move captures,
+        the opponent already threatens a capture, or the new token can
+        itself be captured
+        """
+        idx = coord[0] * self.n + coord[1]
+        if idx in context.capture_cells or context.threat_cells:
+            return True
+        cells = self._cells
+        token = _TOKEN_MAP_IN[self.player]
+        opp_token = _SWAP_PLAYER[token]
+        for corner, opposite, mid in self._capture_mids[idx]:
+            if cells[corner] == 0 and cells[opposite] == opp_token and cells[mid] == token:
+                return True
+        return False
+
+    def quiesce(self, alpha, beta, maximize, depth):
+        """
+        Search the current position (with the player the search is for to
+        move iff maximize) through captures and the moves that block them
+        only, for at most depth more plies. Either player may instead stand
+        pat on the static evaluation
+        """
+        stand_pat = self.eval()
+        if depth == 0:
+            return stand_pat
+        if maximize:
+            if stand_pat >= beta:
+                return stand_pat
+            alpha = max(alpha, stand_pat)
+        else:
+            if stand_pat <= alpha:
+                return stand_pat
+            beta = min(beta, stand_pat)
+
+        player = self.original_player if maximize else _OPPONENT[self.original_player]
+        token = _TOKEN_MAP_IN[player]
+        threats = ThreatMaps(self.board_array())
+        moves = flatnonzero(threats.captures(token) | threats.captures(_SWAP_PLAYER[token])).tolist()
+
+        best = stand_pat
+        for idx in moves:
+            coord = self._coords[idx]
+            self.push_token(coord, token)
+            chains = self.chains[player]
+            if self.connects(player, *chains.ends(chains.label[idx])):
+                score = _WIN_SCORE + depth if maximize else -_WIN_SCORE - depth
+            else:
+                score = self.quiesce(alpha, beta, not maximize, depth - 1)
+            self.pop_token()
+            if maximize:
+                best = max(best, score)
+                alpha = max(alpha, best)
+            else:
+                best = min(best, score)
+                beta = min(beta, best)
+            if alpha >= beta:
+                break
+        return best
+
+    def check_abort(self):
+        """
+        Raise SearchAborted if the search has been cancelled from another
+        process
+        """
+        if self.abort is not None and self.abort.value:
+            raise SearchAborted
 
     def minimax(self, move, depth, alpha, beta, maximize):
-        
+        """
+        Alpha-beta search of the position reached by move (already on the
+        board), with the player the search is for to move iff maximize
+        """
+        self.check_abort()
+        self.pv_lines[depth] = []
+
+        # The game is over if move connected its player's borders
+        mover = _OPPONENT[self.original_player] if maximize else self.original_player
+        mover_chains = self.chains[mover]
+        cid = mover_chains.label[move[0] * self.n + move[1]]
+        if cid != 0 and self.connects(mover, *mover_chains.ends(cid)):
+            return -_WIN_SCORE - depth if maximize else _WIN_SCORE + depth
+
         if depth == 0:
-            return self.eval(move)
+            return self.quiesce(alpha, beta, maximize, _QUIESCENCE_DEPTH)
+
+        self.player = self.original_player if maximize else _OPPONENT[self.original_player]
+        token = _TOKEN_MAP_IN[self.player]
+        context = self.eval_context()
+        self.nodes += 1
+
         if maximize:
-            self.player = self.original_player
             max_eval = -inf
-            for move in self.get_possible_moves():
-                self.set_token(move, _TOKEN_MAP_IN[self.player])
-                f_eval = self.minimax(move, depth - 1, alpha, beta, False)
-                self.set_token(move, 0)
-                max_eval = max(max_eval, f_eval)
+            for i, (move, leaf_score) in enumerate(self.pick_moves(context, depth)):
+                if leaf_score is not None:
+                    f_eval = leaf_score
+                else:
+                    self.push_token(move, token)
+                    f_eval = self.minimax(move, depth - 1, alpha, beta, False)
+                    self.pop_token()
+                    self.player = self.original_player
+                if f_eval > max_eval:
+                    max_eval = f_eval
+                    self.pv_lines[depth] = [move] + (self.pv_lines[depth - 1] if leaf_score is None else [])
                 alpha = max(alpha, max_eval)
-                if alpha < beta:
+                if alpha >= beta:
+                    self.record_cutoff(move, depth, i)
                     break
-            return max_eval
+            # With no moves to search (a full board), the position stands
+            return max_eval if max_eval > -inf else self.eval()
         else:
-            if self.player == RED:
-                self.player = BLUE
-            else:
-                self.player = RED 
             min_eval = +inf
-            for move in self.get_possible_moves():
-                self.set_token(move, _TOKEN_MAP_IN[self.player])
-                f_eval = self.minimax(move, depth - 1, alpha, beta, True)
-                self.set_token(move, 0)
-                min_eval = min(min_eval, f_eval)
+            for i, (move, leaf_score) in enumerate(self.pick_moves(context, depth)):
+                if leaf_score is not None:
+                    f_eval = leaf_score
+                else:
+                    self.push_token(move, token)
+                    f_eval = self.minimax(move, depth - 1, alpha, beta, True)
+                    self.pop_token()
+                    self.player = _OPPONENT[self.original_player]
+                if f_eval < min_eval:
+                    min_eval = f_eval
+                    self.pv_lines[depth] = [move] + (self.pv_lines[depth - 1] if leaf_score is None else [])
                 beta = min(beta, min_eval)
-                if alpha < beta:
+                if alpha >= beta:
+                    self.record_cutoff(move, depth, i)
                     break
-            return min_eval
+            return min_eval if min_eval < +inf else self.eval()
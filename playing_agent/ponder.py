@@ -0,0 +1,175 @@
+"""
+Pondering: searching on the opponent's time.
+
+A Ponderer forks one worker process (see the workers module) when the
+player is created. Once the player has moved, the worker predicts the
+opponent's reply (by searching the position as the opponent would, with a
+replica of this agent playing the opponent's colour), plays it on its
+replica of the player, and searches the player's answer. If the opponent's
+actual move is the predicted one, the player takes the worker's answer
+instead of searching itself. Otherwise the worker's search is cancelled
+through a shared flag, which the replicas check at every node of their
+searches (and proof-number searches) and before generating their root
+moves, and the work is thrown away. The ponderer keeps count of how often
+its predictions were right and wrong (reported with the search statistics).
+"""
+
+import multiprocessing
+
+from playing_agent.workers import Worker
+
+# Per-worker state (set up by _init_worker in the worker process)
+_colour = None
+_n = None
+_cancel = None
+_prediction = None
+_replicas = {}
+
+# States of the shared prediction: not made yet, a PLACE action, a STEAL
+_UNKNOWN = 0
+_PLACE = 1
+_STEAL = 2
+
+
+def _init_worker(colour, n, cancel, prediction):
+    """
+    Remember the player the worker ponders for.
+    """
+    global _colour, _n, _cancel, _prediction
+    _colour, _n, _cancel, _prediction = colour, n, cancel, prediction
+
+
+def _replica(colour, history):
+    """
+    Returns the worker's replica of a player of the given colour, brought up
+    to date with history (and recreated if it has played a predicted move
+    that did not happen).
+    """
+    from playing_agent.player import Player
+
+    replica = _replicas.get(colour)
+    if replica is None or replica.history != history[:len(replica.history)]:
+        replica = Player(colour, _n, workers=0, ponder=False, stats=False)
+        replica.abort = _cancel
+        _replicas[colour] = replica
+    for player, action in history[len(replica.history):]:
+        replica.turn(player, action)
+    return replica
+
+
+def _ponder(history):
+    """
+    Predict the opponent's reply to the position reached by history (and
+    share it as soon as it is known), then search the player's answer to
+    it. Returns the player's (score, move), or None if the search was
+    cancelled.
+    """
+    from playing_agent.player import SearchAborted
+
+    opponent = "blue" if _colour == "red" else "red"
+    result = None
+    try:
+        reply = _replica(opponent, history).action()
+        if reply[0] == "STEAL":
+            _prediction[:] = [_STEAL, 0, 0]
+        else:
+            _prediction[:] = [_PLACE, reply[1], reply[2]]
+        for colour in (_colour, opponent):
+            _replica(colour, history).turn(opponent, reply)
+        result = _replicas[_colour].make_best_move()
+    except SearchAborted:
+        # The replicas were left in the middle of a search
+        _replicas.clear()
+    return result
+
+
+class Ponderer:
+
+    def __init__(self, colour, n):
+        """
+        Fork the worker process for a player of the given colour on a board
+        of size n.
+        """
+        context = multiprocessing.get_context("fork")
+        self.cancel = context.Value("b", 0)
+        self.prediction = context.Array("i", 3)
+        self.worker = Worker(_init_worker, (colour, n, self.cancel, self.prediction))
+
+        # The game history the pondering job under way (if any) is for
+        # (including the predicted reply, once it has been confirmed)
+        self.history = None
+
+        # Number of predictions that were right and wrong
+        self.hits = 0
+        self.misses = 0
+
+    def start(self, history):
+        """
+        Start pondering on the position reached by history (with the
+        opponent to move), dropping any job whose answer went unused.
+        """
+        self.cancel.value = 1
+        self.finish()
+        self.cancel.value = 0
+        self.prediction[0] = _UNKNOWN
+        self.history = list(history)
+        self.worker.submit(_ponder, self.history)
+
+    def finish(self):
+        """
+        Wait for the pondering job, if any, to end, returning the player's
+        (score, move) it found (None if there is none).
+        """
+        if not self.worker.busy:
+            return None
+        return self.worker.result()
+
+    def predicted(self):
+        """
+        Returns the predicted reply of the opponent, or None if the worker
+        has not made its prediction yet.
+        """
+        state, r, q = self.prediction[:]
+        if state == _PLACE:
+            return ("PLACE", r, q)
+        if state == _STEAL:
+            return ("STEAL",)
+        return None
+
+    def opponent_moved(self, player, action):
+        """
+        Called with the opponent's actual action: keep the pondering job if
+        it predicted the action, and cancel it otherwise.
+        """
+        if not self.worker.busy:
+            return
+        if self.predicted() == tuple(action):
+            self.hits += 1
+            self.history.append((player, action))
+        else:
+            self.misses += 1
+            self.cancel.value = 1
+            self.finish()
+
+    def result(self, history):
+        """
+        Returns the player's (score, move) for the position reached by
+        history, waiting for the worker to finish its search, or None if
+        the worker has not pondered on that position.
+        """
+        if not self.worker.busy or self.history != history:
+            return None
+        return self.finish()
+
+    @property
+    def cpu_time(self):
+        """
+        CPU time used by the worker (not seen by the referee).
+        """
+        return self.worker.cpu_time
+
+    def close(self):
+        """
+        Stop the worker process.
+        """
+        self.worker.close()
@@ -0,0 +1,190 @@
+"""
+Proof-number search for forced wins.
+
+The search tries to prove that the player to move can force a connection
+(or that the opponent can), growing a game tree one leaf at a time towards
+the leaf that is cheapest to settle: the one with the smallest proof number
+(the fewest leaves still to be proved for a win) at nodes where the player
+is to move, and the smallest disproof number at the opponent's nodes. Moves
+are generated on bitmask positions by the solver's rules engine, so captures
+are played exactly.
+
+It is only worth running once a player is about a move away from
+connecting, as it has no heuristic to cut the moves it looks at: the search
+gives up when its tree reaches a given number of nodes.
+"""
+
+from math import inf
+
+from playing_agent.solver import Solver
+
+# Results of a search, for the player to move at its root
+PROVEN = 1
+DISPROVEN = 2
+UNKNOWN = 0
+
+# Searches run so far in this process share one rules engine per board size
+_SOLVERS = {}
+
+
+class ProofNode:
+    """
+    A position in the search tree, with the move that reached it
+    """
+    __slots__ = ("move", "red", "blue", "index", "to_move", "pn", "dn", "dist", "children")
+
+    def __init__(self, move, red, blue, index, to_move):
+        self.move = move
+        self.red = red
+        self.blue = blue
+        self.index = index
+        self.to_move = to_move
+        self.pn = 1
+        self.dn = 1
+
+        # Number of plies until the game ends, once the node is settled
+        self.dist = 0
+        self.children = None
+
+
+class ProofSearch:
+
+    def __init__(self, n):
+        """
+        Prepare to search positions on boards of size n.
+        """
+        self.n = n
+        if n not in _SOLVERS:
+            _SOLVERS[n] = Solver(n)
+        self.rules = _SOLVERS[n]
+        self.nodes = 0
+
+    def search(self, cells, to_move, max_nodes, abort=None):
+        """
+        Search the position with the given token on each flat index and token
+        type to move, stopping once the tree holds max_nodes nodes (or as soon
+        as the shared flag abort, if given, is set). Returns the result for
+        the player to move, along with the move to play: the quickest win if
+        the result is PROVEN, or the longest defence if it is DISPROVEN (None
+        if the result is UNKNOWN).
+        """
+        red = blue = index = 0
+        for cell in range(len(cells) - 1, -1, -1):
+            index = index * 3 + cells[cell]
+        for cell, token in enumerate(cells):
+            if token == 1:
+                red |= 1 << cell
+            elif token == 2:
+                blue |= 1 << cell
+
+        root = ProofNode(None, red, blue, index, to_move)
+        attacker = to_move
+        self.nodes = 1
+        while root.pn and root.dn and self.nodes < max_nodes:
+            if abort is not None and abort.value:
+                return UNKNOWN, None
+
+            # Descend to the most proving node, then back up the new numbers
+            path = [root]
+            node = root
+            while node.children is not None:
+                if node.to_move == attacker:
+                    node = min(node.children, key=lambda child: child.pn)
+                else:
+                    node = min(node.children, key=lambda child: child.dn)
+                path.append(node)
+            self.expand(node, attacker)
+            for node in reversed(path):
+                self.update(node, attacker)
+
+        if root.pn == 0:
+            best = min((child for child in root.children if child.pn == 0), key=lambda child: child.dist)
+            return PROVEN, best.move
+        if root.dn == 0:
+            best = max(root.children, key=lambda child: child.dist)
+            return DISPROVEN, best.move
+        return UNKNOWN, None
+
+    def grow(self, mask):
+        """
+        Returns mask together with every neighbour of its cells.
+        """
+        neighbour_masks = self.rules.neighbour_masks
+        grown = mask
+        while mask:
+            bit = mask & -mask
+            grown |= neighbour_masks[bit.bit_length() - 1]
+            mask ^= bit
+        return grown
+
+    def winning_cells(self, own, other, token):
+        """
+        Returns the mask of empty cells where a token of the given type, with
+        tokens own and opponent tokens other on the board, would connect its
+        borders. Captures only remove opponent tokens, so they cannot change
+        whether a move connects.
+        """
+        low, high = self.rules.borders[token]
+        reach = []
+        for border in (low, high):
+            chain = own & border
+            while True:
+                grown = self.grow(chain) & own
+                if grown == chain:
+                    break
+                chain = grown
+            reach.append(border | self.grow(chain))
+        return reach[0] & reach[1] & ~(own | other) & ((1 << (self.n * self.n)) - 1)
+
+    def expand(self, node, attacker):
+        """
+        Create the children of a leaf, settling those where the game is over
+        or where the player to move can connect at once.
+        """
+        node.children = []
+        mover = node.to_move
+        opp = 3 - mover
+        for move, red, blue, index, won in self.rules.children(node.red, node.blue, node.index, mover):
+            child = ProofNode(move, red, blue, index, opp)
+            if won:
+                winner = mover
+            elif opp == 1 and self.winning_cells(red, blue, 1):
+                winner, child.dist = opp, 1
+            elif opp == 2 and self.winning_cells(blue, red, 2):
+                winner, child.dist = opp, 1
+            else:
+                winner = 0
+            if winner == attacker:
+                child.pn, child.dn = 0, inf
+            elif winner:
+                child.pn, child.dn = inf, 0
+            node.children.append(child)
+        self.nodes += len(node.children)
+
+    def update(self, node, attacker):
+        """
+        Recompute the proof and disproof numbers of an expanded node from
+        those of its children.
+        """
+        children = node.children
+        if node.to_move == attacker:
+            node.pn = min(child.pn for child in children) if children else inf
+            node.dn = sum(child.dn for child in children) if children else 0
+        else:
+            node.pn = sum(child.pn for child in children) if children else 0
+            node.dn = min(child.dn for child in children) if children else inf
+
+        if not children:
+            return
+        if node.pn == 0:
+            dists = [child.dist for child in children if child.pn == 0]
+        elif node.dn == 0:
+            dists = [child.dist for child in children if child.dn == 0]
+        else:
+            return
+
+        # The winner takes the quickest win, and the loser the longest defence
+        if (node.pn == 0) == (node.to_move == attacker):
+            node.dist = 1 + min(dists)
+        else:
+            node.dist = 1 + max(dists)
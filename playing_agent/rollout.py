@@ -0,0 +1,199 @@
+"""
+Batched random playouts, simulated in lockstep with NumPy.
+
+A BatchRollout plays K random games at once from the same position. The K
+boards are kept as a (K, n, n) array of uint8 tokens, flattened to (K, n*n)
+plus one padding column that stands for "outside the board" (so that
+neighbour and capture patterns near the edge can be gathered without
+bounds checks). Every step places one token on a random empty cell of each
+unfinished board, applies diamond captures by matching all twelve patterns
+around the new token at once, and updates, for each player and each of
+their borders, which tokens are connected to that border. A board is won
+as soon as the new token is connected to both of its player's borders.
+"""
+
+import time
+
+import numpy as np
+
+from playing_agent.geometry import neighbour_table, capture_table
+
+# Number of boards simulated together by default
+_BATCH_SIZE = 512
+
+# Number of turns after which the game is drawn (taken from the 'referee' module)
+_MAX_TURNS = 343
+
+# Token stored in the padding column (matches no real token)
+_PAD = 3
+
+# Axis goals for each token type (taken from the 'referee' module)
+_TOKEN_AXIS = {1: 0, 2: 1}
+
+
+class BatchRollout:
+
+    def __init__(self, n, batch_size=_BATCH_SIZE, seed=None):
+        """
+        Set up playouts of batch_size games at a time on a board of size n.
+        """
+        self.n = n
+        self.batch_size = batch_size
+        # Without a seed, draw one from NumPy's global generator, so that
+        # seeding it makes playouts repeatable
+        if seed is None:
+            seed = np.random.randint(1 << 31)
+        self.rng = np.random.default_rng(seed)
+        nn = n * n
+        pad = nn
+
+        # Neighbours of each cell (and of the padding column), padded to 6
+        neighbours = neighbour_table(n)
+        self.neighbours = np.full((nn + 1, 6), pad, dtype=np.intp)
+        for cell, cell_neighbours in enumerate(neighbours):
+            self.neighbours[cell, :len(cell_neighbours)] = cell_neighbours
+
+        # Capture patterns of each cell, padded to 12
+        captures = capture_table(n)
+        self.captures = np.full((nn + 1, 12, 3), pad, dtype=np.intp)
+        for cell, patterns in enumerate(captures):
+            if patterns:
+                self.captures[cell, :len(patterns)] = patterns
+
+        # Cells on each border of each token type
+        self.borders = {}
+        for token, axis in _TOKEN_AXIS.items():
+            sides = []
+            for value in (0, n - 1):
+                mask = np.zeros(nn + 1, dtype=bool)
+                mask[[r * n + q for r in range(n) for q in range(n) if (r, q)[axis] == value]] = True
+                sides.append(mask)
+            self.borders[token] = sides
+
+        # Playouts run and CPU time spent on them, in total
+        self.playouts = 0
+        self.time = 0.0
+
+    def _spread(self, reach, boards, token, rows, cells):
+        """
+        Mark as reached every token of the given type on boards connected to
+        the tokens at (rows, cells), which must be reached already. The
+        search only ever looks at the neighbours of newly reached tokens.
+        """
+        neighbours = self.neighbours
+        while len(rows):
+            rows = np.repeat(rows, 6)
+            cells = neighbours[cells].ravel()
+            new = (boards[rows, cells] == token) & ~reach[rows, cells]
+            rows, cells = rows[new], cells[new]
+            reach[rows, cells] = True
+        return reach
+
+    def _connect(self, boards, token):
+        """
+        Returns, for each border of token, which tokens on boards are
+        connected to it.
+        """
+        stones = boards == token
+        sides = []
+        for border in self.borders[token]:
+            reach = stones & border
+            sides.append(self._spread(reach, boards, token, *reach.nonzero()))
+        return sides
+
+    def run(self, cells, token, max_moves=_MAX_TURNS, record=False):
+        """
+        Play batch_size random games from the position given by cells (the
+        token on each flat index), with token to move, for at most
+        max_moves moves each. Returns an array of the winning token of each
+        game (0 if it was cut short or the board filled up). If record is
+        set, also returns a (batch_size, n*n) array of the token that first
+        played on each cell in each game (0 if neither did).
+        """
+        start = time.process_time()
+        k = self.batch_size
+        nn = self.n * self.n
+        neighbours = self.neighbours
+        captures = self.captures
+
+        row = np.append(np.asarray(cells, dtype=np.uint8), np.uint8(_PAD))
+        boards = np.tile(row, (k, 1))
+        reach = {t: self._connect(boards, t) for t in _TOKEN_AXIS}
+        winners = np.zeros(k, dtype=np.uint8)
+        first = np.zeros((k, nn + 1), dtype=np.uint8) if record else None
+
+        # Original index of each board still being played
+        ids = np.arange(k)
+
+        for _ in range(max_moves):
+            empty = boards == 0
+            playable = empty.any(axis=1)
+            if not playable.all():
+                # Boards with nowhere left to play are drawn
+                boards, ids = boards[playable], ids[playable]
+                empty = empty[playable]
+                reach = {t: [side[playable] for side in sides] for t, sides in reach.items()}
+            m = len(ids)
+            if m == 0:
+                break
+            idx = np.arange(m)
+            opp = 3 - token
+
+            # Place a token on a random empty cell of each board
+            keys = self.rng.random((m, nn + 1), dtype=np.float32)
+            keys[~empty] = -1
+            cell = keys.argmax(axis=1)
+            boards[idx, cell] = token
+            if record:
+                fresh = first[ids, cell] == 0
+                first[ids[fresh], cell[fresh]] = token
+
+            # Captures
+            patterns = captures[cell]
+            values = boards[idx[:, None, None], patterns]
+            hit = (values[:, :, 0] == token) & (values[:, :, 1] == opp) & (values[:, :, 2] == opp)
+            if hit.any():
+                hit_rows, hit_patterns = hit.nonzero()
+                boards[hit_rows, patterns[hit_rows, hit_patterns, 1]] = 0
+                boards[hit_rows, patterns[hit_rows, hit_patterns, 2]] = 0
+                rows = np.unique(hit_rows)
+                for side, connected in zip(reach[opp], self._connect(boards[rows], opp)):
+                    side[rows] = connected
+
+            # Connect the new token to each border it touches or joins
+            around = neighbours[cell]
+            own = boards[idx[:, None], around] == token
+            both = np.ones(m, dtype=bool)
+            for side, border in zip(reach[token], self.borders[token]):
+                around_reached = side[idx[:, None], around]
+                reached = border[cell] | (own & around_reached).any(axis=1)
+                side[idx, cell] = reached
+                both &= reached
+
+                # Tokens the new one joined to the border have to be reached too
+                bridged = (reached & (own & ~around_reached).any(axis=1)).nonzero()[0]
+                if len(bridged):
+                    self._spread(side, boards, token, bridged, cell[bridged])
+
+            # Boards where the new token connects both borders are won
+            if both.any():
+                winners[ids[both]] = token
+                keep = ~both
+                boards, ids = boards[keep], ids[keep]
+                reach = {t: [side[keep] for side in sides] for t, sides in reach.items()}
+
+            token = opp
+
+        self.playouts += k
+        self.time += time.process_time() - start
+        if record:
+            return winners, first[:, :nn]
+        return winners
+
+    def playouts_per_second(self):
+        """
+        Returns the average rate of playouts over every batch run so far.
+        """
+        if self.time == 0:
+            return 0.0
+        return self.playouts / self.time
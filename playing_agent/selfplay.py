@@ -0,0 +1,273 @@
+"""
+Self-play data generation: plays games between agents in worker processes
+and streams every position played to compressed array shards.
+
+Usage:
+    python -m playing_agent.selfplay <n> [-g games] [-w workers] [-o directory]
+        [--shard positions] [--random plies] [-s seed]
+        [--red module] [--blue module]
+
+Each worker process plays every workers-th game, through the referee's Game
+class (without its timers or display), opening it with a few random plies so
+that deterministic agents do not replay the same game. Every position is
+recorded as it is played, into a buffer of a fixed number of positions, and
+once the buffer is full it is written out as one shard, a compressed .npz
+file holding one array per field:
+
+    cells    (positions, n * n) uint8  token on each flat index r * n + q
+                                       (0 empty, 1 red, 2 blue)
+    to_move  (positions,) uint8        token of the side to move
+    move     (positions,) int16        flat index of the cell played, or -1
+                                       for STEAL
+    score    (positions,) float32      the mover's search score (NaN for
+                                       random plies and unsearched moves)
+    winner   (positions,) uint8        token of the game's winner (0 draw)
+    game     (positions,) uint32       index of the game
+    ply      (positions,) uint16       number of actions before the position
+
+A game's positions are only recorded once it is over (the winner is not
+known before), so a shard may run past its size by one game. Shards
+are written under a temporary name and renamed once complete, so they can
+be read while generation is still going on. Each game seeds its random
+plies, and the random and NumPy generators the agents draw from, from its
+index, so a run plays the same games whatever the number of workers (as
+long as the agents' choices do not depend on time, as MCTS budgets do).
+
+NOTE:
+Workers compress and write their own shards, so the parent process only
+counts progress and the throughput grows with the number of cores. The
+pipeline itself (playing random_agent against itself) records about 3.5
+million positions per hour on one core; with the playing agent, the rate is
+bound by its search, at about a quarter of a second per move for n = 7.
+"""
+
+import os
+import sys
+import math
+import time
+import random
+import argparse
+import importlib
+import multiprocessing
+
+import numpy as np
+
+from referee.game import Game
+
+_COLOURS = ("red", "blue")
+
+# Tokens of each colour (as in the referee module)
+_TOKENS = {"red": 1, "blue": 2}
+
+# Maximum number of actions in a game (as in the referee module)
+_MAX_PLIES = 343
+
+# Move code for the STEAL action
+_STEAL = -1
+
+# Message a worker sends once it has played all of its games
+_DONE = None
+
+
+class ShardWriter:
+
+    def __init__(self, directory, prefix, n, size):
+        """
+        Prepare to write shards of size positions (on boards of size n) to
+        directory, naming them after prefix.
+        """
+        self.directory = directory
+        self.prefix = prefix
+        self.size = size
+        self.shards = 0
+
+        # The buffer, with room past size for the rest of the last game
+        self.arrays = self.allocate(n, size + _MAX_PLIES)
+        self.count = 0
+
+    @staticmethod
+    def allocate(n, size):
+        """
+        Returns a zeroed array for each field, for size positions.
+        """
+        return {
+            "cells": np.zeros((size, n * n), dtype=np.uint8),
+            "to_move": np.zeros(size, dtype=np.uint8),
+            "move": np.zeros(size, dtype=np.int16),
+            "score": np.zeros(size, dtype=np.float32),
+            "winner": np.zeros(size, dtype=np.uint8),
+            "game": np.zeros(size, dtype=np.uint32),
+            "ply": np.zeros(size, dtype=np.uint16),
+        }
+
+    def add(self, records):
+        """
+        Add the positions of a game, given as a dictionary of arrays, writing
+        out the buffer once it is full. Returns the path of the shard written
+        (None if there is none).
+        """
+        count = len(records["ply"])
+        for name, array in self.arrays.items():
+            array[self.count:self.count + count] = records[name]
+        self.count += count
+        if self.count >= self.size:
+            return self.flush()
+        return None
+
+    def flush(self):
+        """
+        Write out the positions in the buffer (if any) as a shard, returning
+        its path (None if there were none).
+        """
+        if self.count == 0:
+            return None
+        path = os.path.join(self.directory, f"{self.prefix}-{self.shards:05d}.npz")
+        with open(path + ".tmp", "wb") as f:
+            np.savez_compressed(f, **{name: array[:self.count] for name, array in self.arrays.items()})
+        os.replace(path + ".tmp", path)
+        self.shards += 1
+        self.count = 0
+        return path
+
+
+def random_action(game, rng):
+    """
+    Returns a random PLACE action on an empty cell of the game's board.
+    """
+    n = game.board.n
+    cells = np.frombuffer(game.board.digest(), dtype=int)
+    empty = [cell for cell in np.flatnonzero(cells == 0).tolist()
+             if not (game.nturns == 0 and n % 2 == 1 and cell == (n // 2) * n + n // 2)]
+    cell = rng.choice(empty)
+    return ("PLACE", cell // n, cell % n)
+
+
+def play_game(n, agents, index, seed, random_plies):
+    """
+    Play game number index between players of the Player classes agents
+    (for Red and Blue), returning its positions as a dictionary of arrays.
+    """
+    game_seed = seed * 1000003 + index
+    rng = random.Random(game_seed)
+    random.seed(game_seed)
+    np.random.seed(game_seed % (1 << 32))
+    game = Game(n)
+    players = tuple(agent(colour, n) for agent, colour in zip(agents, _COLOURS))
+    cells, to_move, moves, scores = [], [], [], []
+    while not game.over():
+        turn = game.nturns % 2
+        colour = _COLOURS[turn]
+        cells.append(np.frombuffer(game.board.digest(), dtype=int).astype(np.uint8))
+        to_move.append(_TOKENS[colour])
+        if game.nturns < random_plies:
+            action, score = random_action(game, rng), None
+        else:
+            action = players[turn].action()
+            score = getattr(players[turn], "search_score", None)
+        action = game.update(colour, action)
+        for player in players:
+            player.turn(colour, action)
+        moves.append(_STEAL if action[0] == "STEAL" else action[1] * n + action[2])
+        scores.append(math.nan if score is None or not math.isfinite(score) else score)
+
+    result = game.end()
+    winner = _TOKENS[result.split()[-1]] if result.startswith("winner") else 0
+    count = len(moves)
+    return {
+        "cells": np.array(cells, dtype=np.uint8).reshape(count, n * n),
+        "to_move": np.array(to_move, dtype=np.uint8),
+        "move": np.array(moves, dtype=np.int16),
+        "score": np.array(scores, dtype=np.float32),
+        "winner": np.full(count, winner, dtype=np.uint8),
+        "game": np.full(count, index, dtype=np.uint32),
+        "ply": np.arange(count, dtype=np.uint16),
+    }
+
+
+def _worker(worker, workers, options, messages):
+    """
+    Play every workers-th game, starting with game number worker, writing
+    the positions to this worker's shards and sending the number of
+    positions of each game (and the path of each shard written) to the
+    messages queue.
+    """
+    # The agents print their actions, so keep them out of the output
+    sys.stdout = open(os.devnull, "w")
+
+    # Always report back, so that a failing worker does not leave the parent
+    # waiting for it
+    try:
+        agents = tuple(importlib.import_module(module).Player for module in (options.red, options.blue))
+        writer = ShardWriter(options.output, f"shard-{worker:03d}", options.n, options.shard)
+        for index in range(worker, options.games, workers):
+            records = play_game(options.n, agents, index, options.seed, options.random)
+            messages.put((len(records["ply"]), writer.add(records)))
+        messages.put((0, writer.flush()))
+    finally:
+        messages.put(_DONE)
+
+
+def generate(options, workers):
+    """
+    Play options.games games over the given number of worker processes,
+    printing each shard as it is written. Returns the number of positions
+    and the wall time taken.
+    """
+    os.makedirs(options.output, exist_ok=True)
+    context = multiprocessing.get_context("fork")
+
+    # Workers only ever send small messages, so the queue stays short
+    messages = context.Queue()
+    processes = [context.Process(target=_worker, args=(worker, workers, options, messages))
+                 for worker in range(workers)]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+
+    positions = games = 0
+    running = workers
+    while running:
+        message = messages.get()
+        if message is _DONE:
+            running -= 1
+            continue
+        count, path = message
+        if count:
+            games += 1
+            positions += count
+        if path is not None:
+            print(f"{path}: {games} games, {positions} positions")
+    for process in processes:
+        process.join()
+    return positions, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("n", type=int, help="board size")
+    parser.add_argument("-g", "--games", type=int, default=100,
+                        help="number of games played")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(),
+                        help="number of worker processes")
+    parser.add_argument("-o", "--output", default="selfplay",
+                        help="directory the shards are written to")
+    parser.add_argument("--shard", type=int, default=1 << 16,
+                        help="positions per shard (the size of each worker's buffer)")
+    parser.add_argument("--random", type=int, default=2,
+                        help="number of random plies opening each game")
+    parser.add_argument("-s", "--seed", type=int, default=0,
+                        help="seed of the random plies")
+    parser.add_argument("--red", default="playing_agent",
+                        help="module of the agent playing Red")
+    parser.add_argument("--blue", default="playing_agent",
+                        help="module of the agent playing Blue")
+    args = parser.parse_args()
+
+    workers = max(1, min(args.workers, args.games))
+    positions, elapsed = generate(args, workers)
+    print(f"{positions} positions in {elapsed:.1f}s over {workers} workers "
+          f"({positions * 3600 / elapsed:.0f} positions/hour)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,461 @@
+"""
+Solved-position tables for small boards.
+
+A table for a board of size n holds the game theoretic value of every
+position for the side to move (WIN, LOSS or DRAW), along with the number of
+plies the game lasts from it with best play (the winner winning as quickly
+as it can, and the loser holding out as long as it can), packed into one
+byte per position. A position is indexed by reading the tokens of
+its cells (in flat index order, least significant first) as the digits of a
+base 3 number, times two, plus one if Blue is to move. The whole index space
+is stored, so a table has 2 * 3^(n * n) entries: about 39KB for n = 3 and
+86MB for n = 4. Like opening books, tables are memory-mapped.
+
+Tables are built offline, by running:
+
+    python -m playing_agent.build_table <n>
+
+which solves every position by retrograde analysis (with captures and the
+swap rule): positions where the game is over are settled first, then those
+one ply from the end, and so on until a pass settles nothing more. Captures
+let a game go on forever, so positions left unsettled are ones where neither
+side can force a connection, and are recorded as DRAW (the referee ends such
+games on repeated positions or on its turn limit, which no forced win on a
+board this small comes close to).
+
+NOTE:
+Only the table for n = 3 comes with the agent. The table for n = 4 is too
+large to ship, but takes under two minutes and about 0.5GB of memory to
+build (no larger board can be solved this way). The perfect player built on
+these tables is the solved_agent module.
+"""
+
+import os
+import struct
+
+import numpy as np
+
+from playing_agent.geometry import flat_coords, neighbour_table, capture_table
+from playing_agent.book import BOOK_DIR, STEAL
+
+# Values of a position for the side to move
+UNKNOWN = 0
+WIN = 1
+LOSS = 2
+DRAW = 3
+
+# Value of a position for the side that has just moved into it
+_FLIP = (UNKNOWN, LOSS, WIN, DRAW)
+
+# File layout: magic, version, board size, then the entry of every
+# position: its value, plus its number of plies shifted left by _PLY_SHIFT
+_MAGIC = b"CXSV"
+_VERSION = 2
+_HEADER = struct.Struct("<4sHHxxxx")
+_PLY_SHIFT = 2
+_MAX_PLIES = 0xFF >> _PLY_SHIFT
+
+# Number of positions each pass of the retrograde analysis handles at once
+_CHUNK = 1 << 20
+
+# Tables opened so far in this process, keyed by board size (None if there
+# is no table for that size)
+_OPEN_TABLES = {}
+
+
+def table_path(n):
+    """
+    Returns the path of the solved table for boards of size n.
+    """
+    return os.path.join(BOOK_DIR, f"solved_{n}.bin")
+
+
+def position_index(cells, to_move):
+    """
+    Returns the table index of the position with the given token on each
+    flat index and token type to move.
+    """
+    index = 0
+    for token in reversed(cells):
+        index = index * 3 + token
+    return index * 2 + (to_move - 1)
+
+
+def steal_cells(cells, n):
+    """
+    Returns the tokens on each flat index after a STEAL action (see the
+    'referee' module): the board is mirrored along its major axis and the
+    token types are swapped.
+    """
+    return [(0, 2, 1)[cells[q * n + r]] for r, q in flat_coords(n)]
+
+
+class SolvedTable:
+
+    def __init__(self, path):
+        """
+        Memory-map the table stored at path.
+        """
+        with open(path, "rb") as f:
+            magic, version, n = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f"{path} is not a solved table")
+        self.n = n
+        self.entries = np.memmap(path, dtype=np.uint8, mode="r", offset=_HEADER.size)
+        self.capture_patterns = capture_table(n)
+
+    @staticmethod
+    def load(n):
+        """
+        Returns the table for boards of size n (shared by every player in
+        the process), or None if there is none.
+        """
+        if n not in _OPEN_TABLES:
+            path = table_path(n)
+            _OPEN_TABLES[n] = SolvedTable(path) if os.path.exists(path) else None
+        return _OPEN_TABLES[n]
+
+    def value(self, cells, to_move):
+        """
+        Returns the value of a position for the token type to move, along
+        with the number of plies the game lasts from it.
+        """
+        entry = int(self.entries[position_index(cells, to_move)])
+        return entry & 3, entry >> _PLY_SHIFT
+
+    def child(self, cells, cell, token):
+        """
+        Returns the tokens on each flat index after token is placed on the
+        empty cell (with any captures it makes applied).
+        """
+        cells = list(cells)
+        cells[cell] = token
+        opp = 3 - token
+
+        # Overlapping diamonds can share captured cells, so every capture is
+        # found before any is removed
+        captured = [(mid1, mid2) for opposite, mid1, mid2 in self.capture_patterns[cell]
+                    if cells[opposite] == token and cells[mid1] == opp and cells[mid2] == opp]
+        for mid1, mid2 in captured:
+            cells[mid1] = cells[mid2] = 0
+        return cells
+
+    def move_value(self, cells, to_move, move):
+        """
+        Returns the value for the token type to move of playing move (a flat
+        cell index, or STEAL), with the number of plies the game lasts after
+        it (0 if the move connects at once).
+        """
+        if move == STEAL:
+            value, plies = self.value(steal_cells(cells, self.n), 1)
+        else:
+            value, plies = self.value(self.child(cells, move, to_move), 3 - to_move)
+        return _FLIP[value], plies
+
+    def moves(self, cells, to_move):
+        """
+        Returns the legal moves of the token type to move: flat cell indices,
+        and STEAL if it may steal.
+        """
+        n = self.n
+        moves = [cell for cell, token in enumerate(cells) if token == 0]
+
+        # Red may not open in the centre of an odd sized board
+        if len(moves) == n * n and n % 2 == 1:
+            moves.remove((n // 2) * n + n // 2)
+        if to_move == 2 and len(moves) == n * n - 1 and sum(cells) == 1:
+            moves.append(STEAL)
+        return moves
+
+    def best_move(self, cells, to_move):
+        """
+        Returns a move of best value for the token type to move: a flat cell
+        index, or STEAL. Won games are won as quickly as possible, and lost
+        ones drawn out as long as possible.
+        """
+        rank = {WIN: 0, DRAW: 1, LOSS: 2}
+        options = []
+        for move in self.moves(cells, to_move):
+            value, plies = self.move_value(cells, to_move, move)
+            options.append((rank[value], plies if value == WIN else -plies, move))
+        return min(options)[2]
+
+    def unsound(self, keys):
+        """
+        Returns the number of positions, out of those with the given table
+        indices, whose entry best_move does not bear out (0 for a sound
+        table): the best move has to keep the value, and bring the end of
+        the game one ply closer. Positions where the game is over are
+        skipped.
+        """
+        count = 0
+        for key in keys:
+            to_move = key % 2 + 1
+            index = key // 2
+            cells = []
+            for _ in range(self.n * self.n):
+                index, token = divmod(index, 3)
+                cells.append(token)
+            value, plies = self.value(cells, to_move)
+            if value == WIN or value == LOSS:
+                if plies == 0:
+                    continue
+                expected = (value, plies - 1)
+            else:
+                expected = (value, 0)
+            if self.move_value(cells, to_move, self.best_move(cells, to_move)) != expected:
+                count += 1
+        return count
+
+
+class Solver:
+
+    def __init__(self, n):
+        """
+        Prepare to solve boards of size n. Positions are held as a pair of
+        bitmasks (one per token type) along with their table index.
+        """
+        self.n = n
+        nn = n * n
+        coords = flat_coords(n)
+        self.powers = [3 ** cell for cell in range(nn)]
+        self.neighbour_masks = [sum(1 << other for other in neighbours)
+                                for neighbours in neighbour_table(n)]
+        self.capture_patterns = [tuple((1 << a, 1 << b, 1 << c) for a, b, c in patterns)
+                                 for patterns in capture_table(n)]
+
+        # Cells of each token type's low and high borders
+        self.borders = {}
+        for token, axis in ((1, 0), (2, 1)):
+            self.borders[token] = tuple(sum(1 << cell for cell, coord in enumerate(coords)
+                                            if coord[axis] == side) for side in (0, n - 1))
+
+        # Moves are tried from the centre of the board outwards
+        centre = (n - 1) / 2
+        self.order = sorted(range(nn), key=lambda cell: (abs(coords[cell][0] - centre) +
+                                                         abs(coords[cell][1] - centre), cell))
+        self.centre = (n // 2) * n + n // 2 if n % 2 == 1 else -1
+
+    def connected(self, own, cell, token):
+        """
+        True iff the chain of own (the tokens of the given type) holding
+        cell reaches both of the type's borders.
+        """
+        low, high = self.borders[token]
+        if not (own & low and own & high):
+            return False
+        neighbour_masks = self.neighbour_masks
+        chain = frontier = 1 << cell
+        while frontier:
+            grown = 0
+            while frontier:
+                bit = frontier & -frontier
+                grown |= neighbour_masks[bit.bit_length() - 1]
+                frontier ^= bit
+            frontier = grown & own & ~chain
+            chain |= frontier
+        return bool(chain & low) and bool(chain & high)
+
+    def play(self, own, other, index, cell, token):
+        """
+        Place token on the empty cell, returning the new masks (of the mover
+        and its opponent) and table index, without the side to move term.
+        """
+        own |= 1 << cell
+        index += token * self.powers[cell]
+        captured = 0
+        for opposite, mid1, mid2 in self.capture_patterns[cell]:
+            if own & opposite and other & mid1 and other & mid2:
+                # Overlapping diamonds can capture the same cell twice
+                captured |= mid1 | mid2
+        if captured:
+            other ^= captured
+            opp = 3 - token
+            while captured:
+                bit = captured & -captured
+                index -= opp * self.powers[bit.bit_length() - 1]
+                captured ^= bit
+        return own, other, index
+
+    def children(self, red, blue, index, to_move):
+        """
+        Yields each move of the token type to move (a flat cell index, or
+        STEAL), the masks and table index (without the side to move term) of
+        the position it reaches, and whether it wins the game.
+        """
+        occupied = red | blue
+        if to_move == 1:
+            own, other = red, blue
+        else:
+            own, other = blue, red
+        for cell in self.order:
+            if occupied >> cell & 1 or (occupied == 0 and cell == self.centre):
+                continue
+            new_own, new_other, new_index = self.play(own, other, index, cell, to_move)
+            won = self.connected(new_own, cell, to_move)
+            if to_move == 1:
+                yield cell, new_own, new_other, new_index, won
+            else:
+                yield cell, new_other, new_own, new_index, won
+
+        # Blue may steal Red's opening move
+        if to_move == 2 and blue == 0 and red & (red - 1) == 0 and red:
+            cell = red.bit_length() - 1
+            r, q = flat_coords(self.n)[cell]
+            stolen = q * self.n + r
+            yield STEAL, 0, 1 << stolen, 2 * self.powers[stolen], False
+
+    def spans(self, own, token):
+        """
+        True iff own (the tokens of the given type) holds a chain that
+        reaches both of the type's borders.
+        """
+        low, high = self.borders[token]
+        neighbour_masks = self.neighbour_masks
+        chain = 0
+        frontier = own & low
+        while frontier:
+            chain |= frontier
+            grown = 0
+            while frontier:
+                bit = frontier & -frontier
+                grown |= neighbour_masks[bit.bit_length() - 1]
+                frontier ^= bit
+            frontier = grown & own & ~chain
+        return bool(chain & high)
+
+    def board_masks(self):
+        """
+        Returns the masks of Red's and Blue's tokens on every board, as two
+        arrays indexed by the board's index (a table index halved).
+        """
+        nn = self.n * self.n
+        boards = 3 ** nn
+        dtype = np.uint16 if nn <= 16 else np.uint32
+        red = np.zeros(boards, dtype=dtype)
+        blue = np.zeros(boards, dtype=dtype)
+        for start in range(0, boards, _CHUNK):
+            index = np.arange(start, min(start + _CHUNK, boards))
+            for cell in range(nn):
+                index, token = np.divmod(index, 3)
+                red[start:start + len(index)] |= (token == 1).astype(dtype) << cell
+                blue[start:start + len(index)] |= (token == 2).astype(dtype) << cell
+        return red, blue
+
+    def settle(self, entries, key, red, blue, index, to_move):
+        """
+        Set the entry of one position from those of the positions its moves
+        reach, returning it.
+        """
+        wins, losses, draw = [], [], False
+        for *_, child_index, _ in self.children(red, blue, index, to_move):
+            entry = int(entries[child_index * 2 + (2 - to_move)])
+            value, plies = entry & 3, entry >> _PLY_SHIFT
+            if value == LOSS:
+                wins.append(plies)
+            elif value == WIN:
+                losses.append(plies)
+            else:
+                draw = True
+        if wins:
+            entries[key] = WIN | (min(wins) + 1) << _PLY_SHIFT
+        elif draw or not losses:
+            entries[key] = DRAW
+        else:
+            entries[key] = LOSS | (max(losses) + 1) << _PLY_SHIFT
+        return entries[key]
+
+    def solve_all(self, progress=None):
+        """
+        Solve every position by retrograde analysis, returning the entry of
+        each table index (see the module's docstring). After every pass,
+        progress (if given) is called with the number of plies of the
+        positions it settled and how many there were.
+        """
+        nn = self.n * self.n
+        boards = 3 ** nn
+        red, blue = self.board_masks()
+        spanning = {token: np.array([self.spans(mask, token) for mask in range(1 << nn)])
+                    for token in (1, 2)}
+
+        # Table index offset of the tokens in each set of cells
+        masks = np.arange(1 << nn)
+        mask_index = np.zeros(1 << nn, dtype=np.int64)
+        for cell in range(nn):
+            mask_index += (masks >> cell & 1) * self.powers[cell]
+
+        # The game is over once either side connects: the side to move has
+        # lost, unless it is the one that connected (which no game reaches)
+        entries = np.zeros(2 * boards, dtype=np.uint8)
+        for start in range(0, boards, _CHUNK):
+            stop = min(start + _CHUNK, boards)
+            red_spans = spanning[1][red[start:stop]]
+            blue_spans = spanning[2][blue[start:stop]]
+            entries[2 * start:2 * stop:2] = np.where(blue_spans, LOSS, np.where(red_spans, WIN, UNKNOWN))
+            entries[2 * start + 1:2 * stop:2] = np.where(red_spans, LOSS, np.where(blue_spans, WIN, UNKNOWN))
+
+        # Each pass settles the positions one ply further from the end: wins
+        # with a move to a lost position, and losses where every move leads
+        # to a won one, going by the entries of the previous pass only
+        plies = 0
+        while True:
+            plies += 1
+            if plies > _MAX_PLIES:
+                raise ValueError(f"positions take more than {_MAX_PLIES} plies to settle")
+            previous = entries.copy()
+            settled = 0
+            for start in range(0, 2 * boards, _CHUNK):
+                keys = start + np.flatnonzero(previous[start:start + _CHUNK] == UNKNOWN)
+                if len(keys) == 0:
+                    continue
+                board = keys >> 1
+                red_to_move = (keys & 1) == 0
+                own = np.where(red_to_move, red[board], blue[board])
+                other = np.where(red_to_move, blue[board], red[board])
+                occupied = own | other
+                token = np.where(red_to_move, 1, 2)
+                child_side = (keys & 1) ^ 1
+
+                won = np.zeros(len(keys), dtype=bool)
+                lost = np.ones(len(keys), dtype=bool)
+                for cell in range(nn):
+                    empty = (occupied >> cell & 1) == 0
+
+                    # Overlapping diamonds can capture the same cell twice
+                    captured = np.zeros_like(own)
+                    for opposite, mid1, mid2 in self.capture_patterns[cell]:
+                        mids = mid1 | mid2
+                        captured |= np.where((own & opposite != 0) & (other & mids == mids), mids, 0).astype(own.dtype)
+                    child = board + token * self.powers[cell] - (3 - token) * mask_index[captured]
+                    value = previous[np.where(empty, child * 2 + child_side, 0)] & 3
+                    won |= empty & (value == LOSS)
+                    lost &= ~empty | (value == WIN)
+
+                # Positions without moves (full boards) are always over
+                entries[keys[won]] = WIN | plies << _PLY_SHIFT
+                entries[keys[lost & ~won]] = LOSS | plies << _PLY_SHIFT
+                settled += int(won.sum() + (lost & ~won).sum())
+            if progress is not None:
+                progress(plies, settled)
+            if settled == 0:
+                break
+        entries[entries == UNKNOWN] = DRAW
+
+        # Blue may steal Red's opening move, and Red may not open in the
+        # centre: the positions these rules apply to can only be reached at
+        # the start of the game, so they are settled again once everything
+        # else is
+        for _, opening_red, opening_blue, opening_index, _ in self.children(0, 0, 0, 1):
+            self.settle(entries, opening_index * 2 + 1, opening_red, opening_blue, opening_index, 2)
+        self.settle(entries, 0, 0, 0, 0, 1)
+        return entries
+
+
+def write_table(path, n, entries):
+    """
+    Write a table holding entries, an array of the entry of each table
+    index.
+    """
+    with open(path, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, _VERSION, n))
+        f.write(entries.tobytes())
@@ -0,0 +1,105 @@
+"""
+Per-move search statistics for the playing agent.
+
+A SearchStats records, for every action the player chooses, how much work
+went into it: nodes searched, leaf evaluations, A* searches and the cells
+they expanded, evaluation cache hits and misses, cutoffs by the index of the
+move that caused them, the CPU time of each depth searched (and of worker
+processes, which the referee does not see), the principal variation found,
+and, when pondering, whether the opponent's move was the predicted one.
+Each action is written out as one JSON object per line, to stderr or
+appended to a file, so runs can be compared with a few lines of scripting.
+
+The player counts its work over the whole game (see Player.nodes and the
+counters next to it); a SearchStats takes the difference across each call
+to action, so the search itself pays nothing extra for it.
+
+Statistics are off unless asked for, with the player's stats option or the
+PLAYING_AGENT_STATS environment variable: "1" (or "-") for stderr, or the
+path of a file.
+"""
+
+import sys
+import json
+import math
+import time
+
+# Player counters reported as the amount they grew by during an action
+_COUNTERS = ("nodes", "evals", "astar_calls", "astar_expansions", "cutoffs", "searches")
+
+
+class SearchStats:
+
+    def __init__(self, destination):
+        """
+        Write statistics to destination: "1" or "-" for stderr, or the path
+        of a file to append to.
+        """
+        if destination in ("1", "-"):
+            self.stream = sys.stderr
+        else:
+            self.stream = open(destination, "a")
+        self.start = None
+        self.counters = None
+
+        # Ponder hits and misses up to the end of the previous action
+        self.pondered = (0, 0)
+
+    def begin(self, player):
+        """
+        Called as the player starts choosing an action.
+        """
+        self.start = time.process_time()
+        self.counters = self.snapshot(player)
+
+    def snapshot(self, player):
+        """
+        Returns the current values of the player's counters.
+        """
+        counters = {name: getattr(player, name) for name in _COUNTERS}
+        counters["cutoff_indices"] = list(player.cutoff_indices)
+        cache = player.eval_cache
+        counters["cache_hits"] = cache.hits if cache is not None else 0
+        counters["cache_misses"] = cache.misses if cache is not None else 0
+        counters["worker_time"] = player.worker_time()
+        ponderer = player.ponderer
+        counters["ponder_hits"] = ponderer.hits if ponderer is not None else 0
+        counters["ponder_misses"] = ponderer.misses if ponderer is not None else 0
+        return counters
+
+    def end(self, player, action):
+        """
+        Called with the action the player chose: write out its statistics.
+        """
+        before = self.counters
+        after = self.snapshot(player)
+        record = {
+            "turn": player.n_turns,
+            "colour": player.original_player,
+            "action": list(action),
+            "time": round(time.process_time() - self.start, 6),
+            "worker_time": round(after["worker_time"] - before["worker_time"], 6),
+        }
+        for name in _COUNTERS + ("cache_hits", "cache_misses"):
+            record[name] = after[name] - before[name]
+        indices = after["cutoff_indices"]
+        previous = before["cutoff_indices"] + [0] * (len(indices) - len(before["cutoff_indices"]))
+        record["cutoffs_by_index"] = [now - then for now, then in zip(indices, previous)]
+
+        # The opponent's move is checked against the prediction before the
+        # action begins, so pondering is counted from the previous action on
+        if player.ponderer is not None:
+            record["ponder_hits"] = after["ponder_hits"] - self.pondered[0]
+            record["ponder_misses"] = after["ponder_misses"] - self.pondered[1]
+        self.pondered = (after["ponder_hits"], after["ponder_misses"])
+
+        # The action was searched for here, or pondered in the worker process
+        # (which leaves no timings or variation behind). With no moves to
+        # search, the score is infinite and left out
+        if player.search_score is not None and math.isfinite(player.search_score):
+            record["score"] = player.search_score
+        if record["searches"]:
+            record["depth_times"] = [[depth, round(seconds, 6)] for depth, seconds in player.depth_times]
+            record["pv"] = [list(move) for move in player.pv]
+        self.stream.write(json.dumps(record) + "\n")
+        self.stream.flush()
@@ -0,0 +1,127 @@
+"""
+Whole-board threat maps, computed with shifted NumPy arrays.
+
+The board (indexed [r, q] as in the 'referee' module) is padded with two
+rings of off-board cells, so that for any offset of up to two hex steps the
+cells at that offset from every cell form a plain slice of the padded
+array. A pattern around a cell then becomes a few comparisons of slices,
+evaluated for the whole board at once instead of cell by cell.
+"""
+
+import numpy as np
+
+from playing_agent.geometry import HEX_STEPS, CAPTURE_STEPS
+
+# Width of the off-board padding, and the token stored in it
+_PAD = 2
+_OFF_BOARD = 3
+
+# Offsets of the cells at distance 2 from a cell: the far corners of the
+# "longways" diamonds (bridges) and two steps in a straight line
+_DISTANCE_2_STEPS = tuple(opposite for opposite, _, _ in CAPTURE_STEPS[:6]) + \
+    tuple((2 * dr, 2 * dq) for dr, dq in HEX_STEPS)
+
+# Bridge intrusion patterns, as seen from one of the two empty cells between
+# a bridge's tokens: (offset of one token, offset of the other token, offset
+# of the other empty cell)
+_BRIDGE_STEPS = tuple(
+    ((-a[0], -a[1]), (o[0] - a[0], o[1] - a[1]), (b[0] - a[0], b[1] - a[1]))
+    for o, n1, n2 in CAPTURE_STEPS[:6]
+    for a, b in ((n1, n2), (n2, n1)))
+
+
+class ThreatMaps:
+
+    def __init__(self, board):
+        """
+        Prepare threat maps for an (n, n) array of tokens indexed [r, q].
+        """
+        self.n = n = board.shape[0]
+        padded = np.full((n + 2 * _PAD, n + 2 * _PAD), _OFF_BOARD, dtype=board.dtype)
+        padded[_PAD:_PAD + n, _PAD:_PAD + n] = board
+        self.padded = padded
+        self.empty = board == 0
+        self._planes = {}
+
+    def plane(self, token):
+        """
+        Returns a padded boolean array of the cells holding token.
+        """
+        plane = self._planes.get(token)
+        if plane is None:
+            plane = self.padded == token
+            self._planes[token] = plane
+        return plane
+
+    def shift(self, plane, step):
+        """
+        Returns the (n, n) view of a padded plane holding, for every cell,
+        the value at the given (dr, dq) offset from it.
+        """
+        dr, dq = step
+        n = self.n
+        return plane[_PAD + dr:_PAD + dr + n, _PAD + dq:_PAD + dq + n]
+
+    def neighbour_count(self, mask):
+        """
+        Returns the number of neighbours of every cell that are set in the
+        (n, n) boolean mask.
+        """
+        n = self.n
+        padded = np.zeros((n + 2 * _PAD, n + 2 * _PAD), dtype=np.int8)
+        padded[_PAD:_PAD + n, _PAD:_PAD + n] = mask
+        return sum(self.shift(padded, step) for step in HEX_STEPS)
+
+    def at_distance_two(self, mask):
+        """
+        Returns which cells are at distance exactly 2 from a cell set in the
+        (n, n) boolean mask.
+        """
+        n = self.n
+        padded = np.zeros((n + 2 * _PAD, n + 2 * _PAD), dtype=bool)
+        padded[_PAD:_PAD + n, _PAD:_PAD + n] = mask
+        found = np.zeros((n, n), dtype=bool)
+        for step in _DISTANCE_2_STEPS:
+            found |= self.shift(padded, step)
+        return found
+
+    def captures(self, token):
+        """
+        Returns which empty cells would capture tokens of the other player
+        if token were placed on them.
+        """
+        own = self.plane(token)
+        other = self.plane(3 - token)
+        shift = self.shift
+        found = np.zeros((self.n, self.n), dtype=bool)
+        for opposite, mid1, mid2 in CAPTURE_STEPS:
+            found |= shift(own, opposite) & shift(other, mid1) & shift(other, mid2)
+        return found & self.empty
+
+    def bridge_intrusions(self, token):
+        """
+        Returns which empty cells lie between the two tokens of a bridge of
+        the given token type (two tokens two steps apart with both cells
+        between them empty).
+        """
+        own = self.plane(token)
+        empty = self.plane(0)
+        shift = self.shift
+        found = np.zeros((self.n, self.n), dtype=bool)
+        for first, second, other in _BRIDGE_STEPS:
+            found |= shift(own, first) & shift(own, second) & shift(empty, other)
+        return found & self.empty
+
+    def bridge_repairs(self, token):
+        """
+        Returns which empty cells would complete a bridge of the given token
+        type that the other player has intruded into (holding one of the
+        cells between its tokens).
+        """
+        own = self.plane(token)
+        other = self.plane(3 - token)
+        shift = self.shift
+        found = np.zeros((self.n, self.n), dtype=bool)
+        for first, second, intrusion in _BRIDGE_STEPS:
+            found |= shift(own, first) & shift(own, second) & shift(other, intrusion)
+        return found & self.empty
@@ -0,0 +1,104 @@
+"""
+Worker processes for the playing agent's parallel search and pondering.
+
+A Worker forks one process, which sets itself up with an initializer (to
+create its replica of the player, say) and then runs jobs sent to it over a
+pipe one at a time: a module-level function and its arguments, whose result
+is sent back along with the CPU time it took.
+
+Workers are plain processes talking over pipes rather than a multiprocessing
+Pool, as a pool runs handler threads in the player's own process, and the
+memory arenas of those threads add about 200MB to the virtual memory size
+the referee meters against its space limit.
+
+NOTE:
+The referee only measures the CPU time of its own process, so time spent in
+the workers is invisible to it. Each worker keeps count of the CPU time its
+jobs used (see Worker.cpu_time), which the player reports in its search
+statistics, and workers are only created when explicitly requested.
+"""
+
+import os
+import sys
+import time
+import multiprocessing
+
+from multiprocessing.connection import wait
+
+
+def _serve(connection, initializer, initargs):
+    """
+    Run jobs received on connection until the player's end of it is closed.
+    """
+    # Workers replay every turn, so keep their output out of the game log
+    sys.stdout = open(os.devnull, "w")
+    initializer(*initargs)
+
+    while True:
+        try:
+            function, args = connection.recv()
+        except EOFError:
+            return
+        start = time.process_time()
+        try:
+            result = (True, function(*args))
+        except Exception as error:
+            result = (False, error)
+        connection.send(result + (time.process_time() - start,))
+
+
+class Worker:
+
+    def __init__(self, initializer, initargs=()):
+        """
+        Fork the worker process, which calls initializer with initargs before
+        taking any jobs.
+        """
+        context = multiprocessing.get_context("fork")
+        self.connection, child = context.Pipe()
+
+        # Daemonic, so the process is stopped if the player never closes it
+        self.process = context.Process(target=_serve, args=(child, initializer, initargs),
+                                       daemon=True)
+        self.process.start()
+        child.close()
+
+        # Whether a job is under way, and the CPU time used by jobs so far
+        self.busy = False
+        self.cpu_time = 0.0
+
+    def submit(self, function, *args):
+        """
+        Start running function(*args) in the worker (which must not be busy).
+        """
+        self.connection.send((function, args))
+        self.busy = True
+
+    def result(self):
+        """
+        Wait for the job under way to end, returning its result (or raising
+        the exception it raised).
+        """
+        ok, value, cpu_time = self.connection.recv()
+        self.busy = False
+        self.cpu_time += cpu_time
+        if not ok:
+            raise value
+        return value
+
+    def close(self):
+        """
+        Stop the worker process, even in the middle of a job.
+        """
+        self.process.terminate()
+        self.process.join()
+        self.connection.close()
+
+
+def finished(workers):
+    """
+    Wait until at least one of the busy workers has a result ready, and
+    returns those that do.
+    """
+    busy = {worker.connection: worker for worker in workers if worker.busy}
+    return [busy[connection] for connection in wait(list(busy))]
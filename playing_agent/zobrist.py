@@ -0,0 +1,85 @@
+"""
+Zobrist keys for Cachex positions.
+
+A position's key is the XOR of one random 64-bit number per occupied cell
+(and token type on it), plus one more when Blue is to move. The random
+numbers are drawn from a generator seeded with the board size, so keys are
+the same in every process and can be stored on disk.
+
+Positions that are the same up to a symmetry of the game are given the same
+canonical key (the smallest key of their symmetric variants), together with
+the transform that maps a cell of the position onto the canonical
+orientation. The symmetries are the 180 degree rotation of the board, which
+keeps both players' goals, and the reflection used by STEAL: mirroring the
+board along its major axis (cell (r, q) to (q, r)) and swapping the token
+types, including the one to move. The rotation and the reflection combine
+into a fourth transform, the mirror along the minor axis.
+
+The reflection is not applied to positions with a single token on the board,
+where only Blue may steal, so that the side to move always has the same
+actions in every variant.
+"""
+
+from random import Random
+
+# Transforms between a position and its canonical orientation (REFLECT also
+# swaps the token types)
+IDENTITY = 0
+ROTATE = 1
+REFLECT = 2
+ROTATE_REFLECT = 3
+
+# Cache of key tables, keyed by board size
+_TABLES = {}
+
+
+def zobrist_table(n):
+    """
+    Returns the random numbers for a board of size n: a list with, for each
+    flat index, the numbers for a Red and a Blue token (indexed by token
+    type, with 0 for an empty cell), and the number for Blue to move.
+    """
+    table = _TABLES.get(n)
+    if table is None:
+        rng = Random(n)
+        cells = [(0, rng.getrandbits(64), rng.getrandbits(64)) for _ in range(n * n)]
+        table = (cells, rng.getrandbits(64))
+        _TABLES[n] = table
+    return table
+
+
+def canonical_key(cells, n, to_move):
+    """
+    Returns the canonical key of a position along with the transform from
+    the position to its canonical orientation.
+    """
+    table, blue_to_move = zobrist_table(n)
+    last = n * n - 1
+    key = rotated = blue_to_move if to_move == 2 else 0
+    reflected = reflected_rotated = blue_to_move if to_move == 1 else 0
+    tokens = 0
+    for cell, token in enumerate(cells):
+        if token:
+            tokens += 1
+            key ^= table[cell][token]
+            rotated ^= table[last - cell][token]
+            mirrored = (cell % n) * n + cell // n
+            reflected ^= table[mirrored][3 - token]
+            reflected_rotated ^= table[last - mirrored][3 - token]
+
+    keys = [(key, IDENTITY), (rotated, ROTATE)]
+    if tokens != 1:
+        keys += [(reflected, REFLECT), (reflected_rotated, ROTATE_REFLECT)]
+    return min(keys)
+
+
+def transform_cell(cell, n, transform):
+    """
+    Map a flat index through a transform (every transform is its own
+    inverse, so this maps cells both to and from the canonical orientation).
+    """
+    if transform & REFLECT:
+        cell = (cell % n) * n + cell // n
+    if transform & ROTATE:
+        cell = n * n - 1 - cell
+    return cell
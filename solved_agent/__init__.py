@@ -0,0 +1,8 @@
+# Note:
+# The class defined within this module with the name 'Player' is the
+# class we will test when assessing your project.
+# You can define your player class inside this file, or, as in the
+# example import below, you can define it in another file and import
+# it into this module with the name 'Player':
+
+from solved_agent.player import Player
@@ -0,0 +1,62 @@
+from playing_agent.book import STEAL
+from playing_agent.geometry import flat_coords
+from playing_agent.solver import SolvedTable, steal_cells, table_path
+
+# Action types (taken from 'referee' module)
+_ACTION_PLACE = "PLACE"
+_ACTION_STEAL = "STEAL"
+
+# Maps between player string and internal token type (taken from the 'referee' module)
+_TOKEN_MAP_OUT = {0: None, 1: "red", 2: "blue"}
+_TOKEN_MAP_IN = {v: k for k, v in _TOKEN_MAP_OUT.items()}
+
+
+class Player:
+
+    def __init__(self, player, n):
+        """
+        Called once at the beginning of a game to initialise this player.
+        Set up an internal representation of the game state.
+
+        The parameter player is the string "red" if the player will
+        play as Red, or the string "blue" if the player will play
+        as Blue. The player plays perfectly from the solved table for the
+        board size, which must have been built beforehand (see the
+        playing_agent.build_table module).
+        """
+        self.player = player
+        self.token = _TOKEN_MAP_IN[player]
+        self.n = n
+        self.table = SolvedTable.load(n)
+        if self.table is None:
+            raise ValueError(f"no solved table for n = {n} (expected at {table_path(n)})")
+        self.coords = flat_coords(n)
+        self.cells = [0] * (n * n)
+
+    def action(self):
+        """
+        Called at the beginning of the turn. Based on the current state
+        of the game, select an action to play.
+        """
+        move = self.table.best_move(self.cells, self.token)
+        if move == STEAL:
+            return (_ACTION_STEAL,)
+        r, q = self.coords[move]
+        return (_ACTION_PLACE, r, q)
+
+    def turn(self, player, action):
+        """
+        Called at the end of each player's turn to inform this player of
+        their chosen action. Update your internal representation of the
+        game state based on this. The parameter action is the chosen
+        action itself.
+
+        Note: At the end of your player's turn, the action parameter is
+        the same as what your player returned from the action method
+        above. However, the referee has validated it at this point.
+        """
+        if action[0] == _ACTION_PLACE:
+            _, r, q = action
+            self.cells = self.table.child(self.cells, r * self.n + q, _TOKEN_MAP_IN[player])
+        elif action[0] == _ACTION_STEAL:
+            self.cells = steal_cells(self.cells, self.n)